@@ -2,11 +2,12 @@ from xml.etree import ElementTree
 
 
 class Parser:
-    def __init__(self, path):
+    def __init__(self, path, xml_file=None):
         self.entity_mentions = []
         self.event_mentions = []
         self.relation_mentions = []
-        self.parse_xml(path + '.apf.xml')
+        # an already opened .apf.xml file object can be given instead of reading from `path`
+        self.parse_xml(xml_file if xml_file is not None else path + '.apf.xml')
 
     def parse_xml(self, xml_path):
         tree = ElementTree.parse(xml_path)
@@ -0,0 +1,62 @@
+import os
+import hashlib
+import jsonio
+from fileio import open_file, find_file
+
+
+def document_fingerprint(sentences, version):
+    """Hash of the sentence ids, words and token offsets of a document and of the `version` of the aligner."""
+    h = hashlib.sha1(version.encode('utf-8'))
+    for sent in sentences:
+        h.update('\n{}\t{}\t'.format(sent['id'], '\t'.join(sent['word'])).encode('utf-8'))
+        h.update(' '.join('{}:{}'.format(start, end) for start, end in sent['offset']).encode('utf-8'))
+    return h.hexdigest()
+
+
+class AlignmentCache:
+    """Alignment results of the mentions of one document, kept in `<document>.align.json`.
+
+    The results are only valid for the tokens they were computed on: the file stores the
+    `document_fingerprint` and all its entries are dropped when it changes. Within a
+    fingerprint, an entry is keyed by the mention text and character span (and the span
+    it is searched in for heads and triggers), so after an `.apf.xml` correction only the
+    new or changed mentions are aligned again. `dumps` only keeps the entries looked up
+    in this run, the results of removed mentions are dropped.
+    """
+
+    def __init__(self, fingerprint, entries=None):
+        self.fingerprint = fingerprint
+        self.entries = entries or dict()
+        self.used = dict()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        path = find_file(path)
+        if os.path.exists(path):
+            with open_file(path) as f:
+                data = jsonio.loads(f.read())
+            if data['fingerprint'] == fingerprint:
+                return cls(fingerprint, data['entries'])
+        return cls(fingerprint)
+
+    @staticmethod
+    def key(*fields):
+        return '\x1f'.join(str(field) for field in fields)
+
+    def get(self, key):
+        """Cached result of `key`, None on a miss."""
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.used[key] = value
+        return value
+
+    def put(self, key, value):
+        self.used[key] = value
+
+    def dumps(self):
+        return jsonio.dumps({'fingerprint': self.fingerprint, 'entries': self.used})
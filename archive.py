@@ -0,0 +1,128 @@
+import io
+import os
+import tarfile
+import zipfile
+import threading
+
+# only the members format.py reads are indexed
+member_suffixes = ('.sgm', '.apf.xml')
+
+
+def open_source(path, subdir=''):
+    """Return a reader for the ACE `data` directory or for the original LDC .tgz/.zip archive."""
+    if os.path.isdir(path):
+        return DirectorySource(os.path.join(path, subdir))
+    return ArchiveSource(path, subdir)
+
+
+class DirectorySource:
+    """Files of an unpacked `ace_2005/data/<Language>` tree."""
+    sequential = False
+
+    def __init__(self, root):
+        self.root = root
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.root, name))
+
+    def open(self, name):
+        return open(os.path.join(self.root, name), 'rb')
+
+    def size(self, name):
+        return os.path.getsize(os.path.join(self.root, name))
+
+    def read(self, names):
+        result = []
+        for name in names:
+            with self.open(name) as f:
+                result.append(f.read())
+        return result
+
+    def document_order(self, documents):
+        return list(documents)
+
+
+class ArchiveSource:
+    """Members of an LDC archive, addressed like files below `data/<subdir>/`.
+
+    The member index (the headers, with the offset of every member's data) is built
+    once when the archive is opened, without reading the members. A member is only
+    read when it is opened, one document at a time. In a compressed tar, seeking back
+    decompresses the stream again from the start: a tar source is `sequential`, its
+    documents are to be visited in `document_order` and the files of a document read
+    together with `read`, which reads them in member order.
+    """
+
+    def __init__(self, path, subdir=''):
+        self.path = path
+        self.prefix = 'data/' + subdir.strip('/') + '/' if subdir else 'data/'
+        self.zip = None
+        self.tar = None
+        # pipeline threads share the tar file's offset
+        self.lock = threading.Lock()
+        self.members = {}
+        self.sequential = False
+        if zipfile.is_zipfile(path):
+            self.zip = zipfile.ZipFile(path)
+            for info in self.zip.infolist():
+                name = self._name(info.filename)
+                if name is not None:
+                    self.members[name] = info
+        else:
+            self.sequential = True
+            self.tar = tarfile.open(path, 'r:*')
+            for member in self.tar:
+                if not member.isfile():
+                    continue
+                name = self._name(member.name)
+                if name is not None:
+                    self.members[name] = member
+            # the headers are in self.members, the list of all members is not needed
+            self.tar.members = []
+
+    def _name(self, member_name):
+        """Path of a member relative to `data/<subdir>/`, None if it is not indexed."""
+        if not member_name.endswith(member_suffixes):
+            return None
+        member_name = '/' + member_name.replace('\\', '/').lstrip('./')
+        idx = member_name.find('/' + self.prefix)
+        if idx == -1:
+            return None
+        return member_name[idx + len(self.prefix) + 1:]
+
+    def exists(self, name):
+        return name.replace(os.sep, '/') in self.members
+
+    def open(self, name):
+        member = self.members[name.replace(os.sep, '/')]
+        if self.zip is not None:
+            return self.zip.open(member)
+        with self.lock:
+            return io.BytesIO(self.tar.extractfile(member).read())
+
+    def size(self, name):
+        member = self.members[name.replace(os.sep, '/')]
+        if self.zip is not None:
+            return member.file_size
+        return member.size
+
+    def read(self, names):
+        """Contents of the members `names`, in the order of `names`; tar members are read in archive order."""
+        names = [name.replace(os.sep, '/') for name in names]
+        if self.zip is not None:
+            return [self.zip.read(self.members[name]) for name in names]
+        data = dict()
+        with self.lock:
+            for name in sorted(names, key=lambda name: self.members[name].offset_data):
+                data[name] = self.tar.extractfile(self.members[name]).read()
+        return [data[name] for name in names]
+
+    def _offset(self, document):
+        document = document.replace(os.sep, '/')
+        return min(self.members[document + suffix].offset_data for suffix in member_suffixes)
+
+    def document_order(self, documents):
+        """`documents` (paths without suffix) in the order of their first member in the archive."""
+        if self.zip is not None:
+            return list(documents)
+        return sorted(documents, key=self._offset)
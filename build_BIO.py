@@ -1,8 +1,12 @@
-import json
+import jsonio
 import os
+import struct
 import numpy as np
 from tqdm import tqdm
 import argparse
+from fileio import open_file, find_file, compressed_name, remove_variants, atomic_write, tmp_prefix
+from profiling import Profiler
+from scheduler import run_ordered
 
 
 def get_sentence_token(raw_data):
@@ -13,103 +17,320 @@ def get_sentence_token(raw_data):
     return token
 
 
+def get_sentence_entity_tag(sent):
+    """entity tags of the tokens of one sentence, see `get_entity_tag`"""
+    sent_tag = []
+    for i in range(len(sent['tokens'])):
+        sent_tag.append(['O'])  # because of overlap,get a tag list for each token
+    temp_entity_mentions = sent['golden-entity-mentions']
+    if len(temp_entity_mentions) == 0:  # skip if none
+        return sent_tag
+    type_list = []
+    position_list = []
+    length_list = []
+    for entity in temp_entity_mentions:
+        type_list.append(entity['entity-type'])
+        position_list.append(
+            [entity['position'][0], entity['position'][1] + 1])  # plus 1 to make sure not empty
+        length_list.append(entity['position'][1] - entity['position'][0] + 1)
+    length_list = np.array(length_list)
+    index = np.argsort(length_list)[::-1]  # get the length idx from long to short
+    for idx in index:
+        temp_start = position_list[idx][0]
+        for k in range(length_list[idx]):
+            if k == 0:
+                sent_tag[temp_start + k] += ['B-'+type_list[idx]]
+            else:
+                sent_tag[temp_start + k] += ['I-'+type_list[idx]]
+    for token in sent_tag:  # delete 'O' if token is a named entity
+        if len(token) > 1:
+            del token[0]
+    return sent_tag
+
+
 def get_entity_tag(raw_data):
     """get entity_tag for each token from data (not BIO type)"""
-    entity_tag = []
-    for sent in raw_data:
-        sent_tag = []
-        for i in range(len(sent['tokens'])):
-            sent_tag.append(['O'])
-        entity_tag.append(sent_tag)  # because of overlap,get a tag list for each token
-    for i in range(len(raw_data)):
-        temp_sent = raw_data[i]
-        temp_entity_mentions = temp_sent['golden-entity-mentions']
-        if len(temp_entity_mentions) == 0:  # skip if none
-            continue
-        type_list = []
-        position_list = []
-        length_list = []
-        for entity in temp_entity_mentions:
-            type_list.append(entity['entity-type'])
-            position_list.append(
-                [entity['position'][0], entity['position'][1] + 1])  # plus 1 to make sure not empty
-            length_list.append(entity['position'][1] - entity['position'][0] + 1)
-        length_list = np.array(length_list)
-        index = np.argsort(length_list)[::-1]  # get the length idx from long to short
-        for idx in index:
-            temp_start = position_list[idx][0]
-            for k in range(length_list[idx]):
-                if k == 0:
-                    entity_tag[i][temp_start + k] += ['B-'+type_list[idx]]
-                else:
-                    entity_tag[i][temp_start + k] += ['I-'+type_list[idx]]
-                # entity_tag[i][position_list[idx][0]: position_list[idx][1]] = [type_list[idx]] * int(length_list[idx])
-    for sent in entity_tag:  # delete 'O' if token is a named entity
-        for token in sent:
-            if len(token) > 1:
-                del token[0]
-    return entity_tag
+    return [get_sentence_entity_tag(sent) for sent in raw_data]
 
 
-def get_event_tag(raw_data):
-    event_trigger_tag = []  # initial trigger tag
-    for sent in raw_data:
-        sent_tag = []
-        for _ in range(len(sent['tokens'])):
-            sent_tag.append(['O'])
-        event_trigger_tag.append(sent_tag)  # trigger_tag dont overlap
+def get_sentence_event_tag(sent):
+    """trigger and argument tags of the tokens of one sentence, see `get_event_tag`"""
+    trigger_tag = []  # initial trigger tag
+    for _ in range(len(sent['tokens'])):
+        trigger_tag.append(['O'])  # trigger_tag dont overlap
+    argument_tag = []  # initial argument tag
+    for _ in range(len(sent['tokens'])):
+        argument_tag.append(['O'])  # because of multi-event,get a tag list for each token
 
-    event_argument_tag = []  # initial argument tag
-    for sent in raw_data:
-        sent_tag = []
-        for _ in range(len(sent['tokens'])):
-            sent_tag.append(['O'])
-        event_argument_tag.append(sent_tag)  # because of multi-event,get a tag list for each token
-
-    for i in tqdm(range(len(raw_data)), total=len(raw_data)):
-        temp_sent = raw_data[i]
-        temp_event_mentions = temp_sent['golden-event-mentions']
-        if len(temp_event_mentions) == 0:  # skip if none
-            continue
-        event_cnt = 0  # index events
-        # tag trigger
-        for event in temp_event_mentions:
-            temp_event_type = event['event_type']  # get type
-            trigger_position = [event['trigger']['position'][0], event['trigger']['position'][1] + 1]
-            trigger_length = trigger_position[1] - trigger_position[0]
-            temp_start = trigger_position[0]
-            for k in range(trigger_length):
+    temp_event_mentions = sent['golden-event-mentions']
+    if len(temp_event_mentions) == 0:  # skip if none
+        return trigger_tag, argument_tag
+    event_cnt = 0  # index events
+    # tag trigger
+    for event in temp_event_mentions:
+        temp_event_type = event['event_type']  # get type
+        trigger_position = [event['trigger']['position'][0], event['trigger']['position'][1] + 1]
+        trigger_length = trigger_position[1] - trigger_position[0]
+        temp_start = trigger_position[0]
+        for k in range(trigger_length):
+            if k == 0:
+                trigger_tag[k+temp_start] = ['B-' + temp_event_type + '-' + str(event_cnt)]
+            else:
+                trigger_tag[k+temp_start] = ['I-' + temp_event_type + '-' + str(event_cnt)]
+        # tag arguments
+        for argument in event['arguments']:
+            temp_argument_role = argument['role']
+            argument_position = [argument['position'][0], argument['position'][1] + 1]
+            argument_length = argument_position[1] - argument_position[0]
+            temp_start = argument_position[0]
+            for k in range(argument_length):
                 if k == 0:
-                    event_trigger_tag[i][k+temp_start] = ['B-' + temp_event_type + '-' + str(event_cnt)]
+                    argument_tag[k + temp_start] += ['B-' + temp_argument_role + '-' + str(event_cnt)]
                 else:
-                    event_trigger_tag[i][k+temp_start] = ['I-' + temp_event_type + '-' + str(event_cnt)]
-            # tag arguments
-            for argument in event['arguments']:
-                temp_argument_role = argument['role']
-                argument_position = [argument['position'][0], argument['position'][1] + 1]
-                argument_length = argument_position[1] - argument_position[0]
-                temp_start = argument_position[0]
-                for k in range(argument_length):
-                    if k == 0:
-                        event_argument_tag[i][k + temp_start] += ['B-' + temp_argument_role + '-' + str(event_cnt)]
-                    else:
-                        event_argument_tag[i][k + temp_start] += ['I-' + temp_argument_role + '-' + str(event_cnt)]
-            event_cnt += 1
-
-    for sent in event_argument_tag:  # delete 'O' if token is a named entity
-        for token in sent:
-            if len(token) > 1:
-                del token[0]
+                    argument_tag[k + temp_start] += ['I-' + temp_argument_role + '-' + str(event_cnt)]
+        event_cnt += 1
+
+    for token in argument_tag:  # delete 'O' if token is a named entity
+        if len(token) > 1:
+            del token[0]
+    return trigger_tag, argument_tag
 
+
+def get_event_tag(raw_data):
+    event_trigger_tag = []
+    event_argument_tag = []
+    for sent in tqdm(raw_data, total=len(raw_data)):
+        trigger_tag, argument_tag = get_sentence_event_tag(sent)
+        event_trigger_tag.append(trigger_tag)
+        event_argument_tag.append(argument_tag)
     return event_trigger_tag, event_argument_tag
-   
-    
-def get_BIO(path, type_name, save=False):
-    with open(path) as f:
-        raw_data = json.loads(f.read())
+
+
+def get_sentence_tags(sent):
+    """(entity tags, trigger tags, argument tags) of one sentence"""
+    trigger_tag, argument_tag = get_sentence_event_tag(sent)
+    return get_sentence_entity_tag(sent), trigger_tag, argument_tag
+
+
+def get_chunk_tags(chunk):
+    return [get_sentence_tags(sent) for sent in chunk]
+
+
+def iter_sentence_tags(raw_data, workers=1, chunk_size=512):
+    """Yield `get_sentence_tags` of every sentence in order, computed in chunks of `chunk_size`
+    sentences by `workers` processes when workers > 1."""
+    if workers <= 1:
+        for sent in raw_data:
+            yield get_sentence_tags(sent)
+        return
+    chunks = (raw_data[i:i + chunk_size] for i in range(0, len(raw_data), chunk_size))
+    for tags in run_ordered(get_chunk_tags, chunks, workers, unit='chunks'):
+        yield from tags
+
+
+# per-token fields that transform.py --fields adds, written as one BIO file each
+token_fields = ['token-start', 'token-end', 'upos', 'feats', 'head', 'deprel']
+
+
+def get_token_fields(raw_data):
+    """Parallel per-token arrays of the fields present in the data, {file name: [per sentence list]}"""
+    fields = dict()
+    for field in token_fields:
+        if raw_data and field in raw_data[0]:
+            fields[field.replace('-', '_')] = [sent[field] for sent in raw_data]
+    return fields
+
+
+def get_sentence_span_pairs(i, sent):
+    """(sentence, head span, tail span, label) of the relations and event arguments of sentence `i`.
+
+    Relations go from their Arg-1 to their Arg-2 entity, event arguments from the trigger
+    to the argument. Pairs whose spans are not in the sentence of the mention are skipped.
+    """
+    relations = []
+    for relation in sent['golden-relation-mentions']:
+        args = dict((arg['role'], arg['position']) for arg in relation['arguments']
+                    if arg['sent_id'] == relation['sent_id'])
+        if 'Arg-1' in args and 'Arg-2' in args:
+            relations.append((i, args['Arg-1'], args['Arg-2'], relation['relation-type']))
+    arguments = [(i, event['trigger']['position'], arg['position'], arg['role'])
+                 for event in sent['golden-event-mentions']
+                 for arg in event['arguments'] if arg['sent_id'] == event['sent_id']]
+    return relations, arguments
+
+
+def span_pair_array(pairs):
+    """COO rows (sentence, head start, head end, tail start, tail end) of `pairs` as an int64
+    array of shape (n, 5) with exclusive ends, and the label of each row."""
+    if not pairs:
+        return np.zeros((0, 5), dtype=np.int64), []
+    sent_idx, head, tail, labels = zip(*pairs)
+    spans = np.concatenate([np.array(head, dtype=np.int64), np.array(tail, dtype=np.int64)], axis=1)
+    spans[:, [1, 3]] += 1  # inclusive -> exclusive ends
+    return np.concatenate([np.array(sent_idx, dtype=np.int64)[:, None], spans], axis=1), list(labels)
+
+
+def get_span_pairs(raw_data):
+    """Relations and event arguments of the data, see `get_sentence_span_pairs` and `span_pair_array`."""
+    relations = []
+    arguments = []
+    for i, sent in enumerate(raw_data):
+        sent_relations, sent_arguments = get_sentence_span_pairs(i, sent)
+        relations += sent_relations
+        arguments += sent_arguments
+    return span_pair_array(relations), span_pair_array(arguments)
+
+
+# label lists of `save_span_pairs`, shared by all splits
+label_files = ['relation_labels.json', 'event_argument_labels.json']
+
+
+def reset_labels(BIO_path):
+    """Start a full run with empty label lists, so the ids only depend on the splits of this run
+    (processed in the order train, dev, test)."""
+    for file in label_files:
+        if os.path.exists(BIO_path + file):
+            os.remove(BIO_path + file)
+
+
+def update_labels(path, labels):
+    """Ids of `labels` in the label list at `path`, extended with new labels so all splits share the ids."""
+    known = []
+    if os.path.exists(path):
+        with open_file(path) as f:
+            known = jsonio.loads(f.read())
+    known += sorted(set(labels) - set(known))
+    atomic_write(path, jsonio.dumps(known, pretty=True))
+    ids = dict((label, idx) for idx, label in enumerate(known))
+    return np.array([ids[label] for label in labels], dtype=np.int64)
+
+
+def npy_header(shape, size, version=(1, 0)):
+    """Header of an int64 .npy array of `shape`, padded to `size` bytes like the headers of np.save."""
+    header = "{'descr': '<i8', 'fortran_order': False, 'shape': %r, }" % (tuple(shape),)
+    magic = b'\x93NUMPY' + bytes(version)
+    length = '<H' if version == (1, 0) else '<I'
+    padding = size - len(magic) - struct.calcsize(length) - len(header) - 1
+    if padding < 0:
+        raise Exception('the .npy header of shape %r does not fit in %d bytes' % (shape, size))
+    text = (header + ' ' * padding + '\n').encode('latin1')
+    return magic + struct.pack(length, len(text)) + text
+
+
+class NpyRowWriter:
+    """Write an int64 .npy array of `columns` columns block by block, without holding it.
+
+    The header is written with the final number of rows by `close`, which returns it.
+    With `append`, the rows are added after the first `append` rows of the existing
+    array at `path`, the rows of its last complete write, without reading them.
+    """
+    header_size = 128
+
+    def __init__(self, path, columns, append=None):
+        self.path = path
+        self.columns = columns
+        self.version = (1, 0)
+        if append is None:
+            self.file = open(path, 'wb')
+            self.file.write(npy_header((0, columns), self.header_size))
+            self.rows = 0
+        else:
+            self.file = open(path, 'rb+')
+            self.version = np.lib.format.read_magic(self.file)
+            if self.version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(self.file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(self.file)
+            if dtype != np.dtype('<i8') or fortran_order or len(shape) != 2 or shape[1] != columns or \
+                    shape[0] < append:
+                self.file.close()
+                raise Exception('%s is not an array of %d columns with %d rows' % (path, columns, append))
+            self.header_size = self.file.tell()
+            self.file.truncate(self.header_size + append * columns * 8)
+            self.file.seek(0, os.SEEK_END)
+            self.rows = append
+
+    def write(self, rows):
+        self.file.write(np.ascontiguousarray(rows, dtype='<i8').tobytes())
+        self.rows += len(rows)
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(npy_header((self.rows, self.columns), self.header_size, self.version))
+        self.file.close()
+        return self.rows
+
+
+class SpanPairWriter:
+    """Write `<split>/relations.npy` and `<split>/event_arguments.npy`, int64 rows of
+    (sentence, head start, head end, tail start, tail end, label id), and the label lists.
+
+    The label ids are only known once all labels of the split are (see `update_labels`),
+    so the rows are kept in a temporary file next to the arrays, with ids local to the
+    split, and copied to the arrays in blocks by `close`. With `append_rows` ({array
+    name: rows}), see `NpyRowWriter`. `close` returns the number of rows of each array.
+    """
+    names = ['relations', 'event_arguments']
+    block_rows = 1 << 16
+
+    def __init__(self, BIO_path, type_path, append_rows=None):
+        self.BIO_path = BIO_path
+        self.type_path = type_path
+        self.append_rows = append_rows
+        self.files = dict((name, open(type_path + tmp_prefix + name + '.rows', 'wb+')) for name in self.names)
+        # label -> id within the split, in order of appearance
+        self.labels = dict((name, dict()) for name in self.names)
+
+    def add_rows(self, name, rows, labels):
+        """Add the (n, 5) `rows` of `span_pair_array` and their `labels` to the array `name`."""
+        local = self.labels[name]
+        ids = np.array([local.setdefault(label, len(local)) for label in labels], dtype=np.int64)
+        self.files[name].write(np.concatenate([rows, ids[:, None]], axis=1).astype('<i8').tobytes())
+
+    def add(self, name, pairs):
+        """Add the `get_sentence_span_pairs` of a sentence to the array `name`."""
+        if pairs:
+            self.add_rows(name, *span_pair_array(pairs))
+
+    def close(self):
+        counts = dict()
+        for name in self.names:
+            label_ids = update_labels(self.BIO_path + name[:-1] + '_labels.json', list(self.labels[name]))
+            writer = NpyRowWriter(self.type_path + name + '.npy', 6,
+                                  None if self.append_rows is None else self.append_rows[name])
+            f = self.files[name]
+            f.seek(0)
+            for block in iter(lambda: f.read(self.block_rows * 6 * 8), b''):
+                rows = np.frombuffer(block, dtype='<i8').reshape(-1, 6).copy()
+                rows[:, 5] = label_ids[rows[:, 5]]
+                writer.write(rows)
+            counts[name] = writer.close()
+            f.close()
+            os.remove(f.name)
+        return counts
+
+
+def save_span_pairs(span_pairs, BIO_path, type_path, append_rows=None):
+    """Save the `get_span_pairs` of a split, see `SpanPairWriter`; return the number of rows of each array."""
+    writer = SpanPairWriter(BIO_path, type_path, append_rows)
+    for name, (rows, labels) in zip(writer.names, span_pairs):
+        writer.add_rows(name, rows, labels)
+    return writer.close()
+
+
+def get_BIO(path, type_name, save=False, compress='none', pretty=True, workers=1):
+    with open_file(find_file(path)) as f:
+        raw_data = jsonio.loads(f.read())
     token = get_sentence_token(raw_data)
-    entity_BIO = get_entity_tag(raw_data)
-    event_trigger_BIO, event_argument_BIO = get_event_tag(raw_data)
+    if workers > 1:
+        entity_BIO, event_trigger_BIO, event_argument_BIO = [], [], []
+        for entity_tag, trigger_tag, argument_tag in iter_sentence_tags(raw_data, workers):
+            entity_BIO.append(entity_tag)
+            event_trigger_BIO.append(trigger_tag)
+            event_argument_BIO.append(argument_tag)
+    else:
+        entity_BIO = get_entity_tag(raw_data)
+        event_trigger_BIO, event_argument_BIO = get_event_tag(raw_data)
     if save:
         BIO_path = '/'.join(path.split('/')[:-1]) + '/' + 'BIO/'
         type_path = BIO_path + type_name + '/'
@@ -122,9 +343,16 @@ def get_BIO(path, type_name, save=False):
         except:
             pass
         for name in ['token', 'entity_BIO', 'event_trigger_BIO', 'event_argument_BIO']:
-            out_path = type_path + name + '.json'
-            with open(out_path, 'w', encoding='utf8') as f:
-                f.write(json.dumps(eval(name), indent=4, ensure_ascii=False))
+            out_path = compressed_name(type_path + name + '.json', compress)
+            with open_file(out_path, 'w', encoding='utf8') as f:
+                f.write(jsonio.dumps(eval(name), pretty))
+            remove_variants(out_path)
+        for name, values in get_token_fields(raw_data).items():
+            out_path = compressed_name(type_path + name + '.json', compress)
+            with open_file(out_path, 'w', encoding='utf8') as f:
+                f.write(jsonio.dumps(values, pretty))
+            remove_variants(out_path)
+        save_span_pairs(get_span_pairs(raw_data), BIO_path, type_path)
 
     return token, entity_BIO, event_trigger_BIO, event_argument_BIO
 
@@ -133,11 +361,23 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--lang', type=str, help="Name of the language", default='en',
                         choices=['en', 'ar', 'zh'])
+    parser.add_argument('--compress', type=str, default='none', choices=['none', 'gz', 'xz', 'zst'],
+                        help="Compression of the BIO json files")
+    parser.add_argument('--profile', type=str, default=None,
+                        help="Directory for cProfile (.prof) and tracemalloc reports of every stage")
+    parser.add_argument('--json-format', type=str, default='pretty', choices=['pretty', 'compact'],
+                        help="Layout of the BIO json files")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes tagging chunks of sentences")
     args = parser.parse_args()
+    profiler = Profiler(args.profile, prefix='build_BIO')
     language = args.lang
     data_path = './output/'
     sentence = input("whether transform to BIO tags(y/n):") == 'y'
     if sentence:
-        for type_name in ['train', 'test', 'dev']:
+        reset_labels(data_path + 'BIO/')
+        for type_name in ['train', 'dev', 'test']:
             raw_path = data_path + language + '-' + type_name + '.json'
-            _ = get_BIO(raw_path, type_name, save=True)
+            with profiler.stage(type_name):
+                _ = get_BIO(raw_path, type_name, save=True, compress=args.compress,
+                            pretty=args.json_format == 'pretty', workers=args.workers)
@@ -0,0 +1,60 @@
+import os
+import json
+from fileio import tmp_prefix
+
+
+def remove_partial_files(dirpath):
+    """Delete temporary files left behind by an interrupted `atomic_write`."""
+    if not os.path.isdir(dirpath):
+        return
+    for file in os.listdir(dirpath):
+        if file.startswith(tmp_prefix):
+            os.remove(os.path.join(dirpath, file))
+
+
+class Journal:
+    """Append-only record of the documents a stage has completed in a corpus.
+
+    There is one journal per corpus directory and stage (`.format.journal`,
+    `.extract.journal`), keyed by document id: a document shared by several splits
+    is recorded once, and the splits are only resolved by transform.py. Every line is a json object `{"doc": ..., "stats": {...}}` written after all the
+    outputs of the document are in place, so a rerun can skip the document and still
+    report its statistics. With `resume=False` the journal starts empty.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.completed = {}
+        if resume and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # last line of a run killed while appending
+                        continue
+                    self.completed[entry['doc']] = entry['stats']
+        # rewrite the intact entries, dropping a truncated last line
+        self.file = open(path, 'w', encoding='utf-8')
+        for doc, stats in self.completed.items():
+            self.file.write(json.dumps({'doc': doc, 'stats': stats}) + '\n')
+        self.file.flush()
+
+    def done(self, doc, outputs=()):
+        """Whether `doc` was completed and all its `outputs` still exist."""
+        return doc in self.completed and all(os.path.exists(path) for path in outputs)
+
+    def mark(self, doc, stats):
+        self.completed[doc] = stats
+        self.file.write(json.dumps({'doc': doc, 'stats': stats}) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,66 @@
+"""Streaming CoNLL-U reader for the .conllu files of format.py.
+
+    with open_file(path) as f:
+        for sent in iter_conllu(f, columns=['form', 'misc']):
+            sent.metadata['sent_id'], sent.ids, sent.columns['form'], ...
+
+Sentences are yielded one at a time as parallel per-column lists; only the requested
+columns are kept, values are the raw strings (`_` for empty). Comment lines become the
+`metadata` dict like in the conllu package (`# key = value`, value None without `=`).
+"""
+
+conllu_columns = ['id', 'form', 'lemma', 'upos', 'xpos', 'feats', 'head', 'deprel', 'deps', 'misc']
+
+
+class ConlluSentence:
+    __slots__ = ('metadata', 'ids', 'columns')
+
+    def __init__(self, metadata, ids, columns):
+        self.metadata = metadata
+        self.ids = ids
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def is_word(token_id):
+    """False for multi-word token ranges (`4-5`) and empty nodes (`8.1`)."""
+    return token_id.isdigit()
+
+
+def token_range(misc):
+    """[start, end] of the TokenRange in a MISC value, [-1, -1] if there is none."""
+    if misc != '_':
+        for item in misc.split('|'):
+            if item.startswith('TokenRange='):
+                start, end = item[len('TokenRange='):].split(':')
+                return [int(start), int(end)]
+    return [-1, -1]
+
+
+def iter_conllu(f, columns=('form',)):
+    """Yield the sentences of the CoNLL-U file object `f`, keeping only `columns`."""
+    indices = [(name, conllu_columns.index(name)) for name in columns]
+    metadata = dict()
+    ids = []
+    values = dict((name, []) for name in columns)
+    for line in f:
+        line = line.rstrip('\r\n')
+        if not line:
+            if ids or metadata:
+                yield ConlluSentence(metadata, ids, values)
+                metadata = dict()
+                ids = []
+                values = dict((name, []) for name in columns)
+            continue
+        if line[0] == '#':
+            key, sep, value = line[1:].partition('=')
+            metadata[key.strip()] = value.strip() if sep else None
+            continue
+        cols = line.split('\t')
+        ids.append(cols[0])
+        for name, idx in indices:
+            values[name].append(cols[idx])
+    if ids or metadata:
+        yield ConlluSentence(metadata, ids, values)
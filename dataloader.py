@@ -0,0 +1,138 @@
+"""Batches of the BIO outputs as padded NumPy arrays.
+
+    vocab = load_vocab('output/BIO/vocab.json', [BIODataset('output/BIO/train')])
+    for batch in BatchLoader(BIODataset('output/BIO/train'), vocab, batch_size=32):
+        batch['tokens'], batch['mask'], batch['entity'], ...
+
+A token may carry several tags because of overlapping mentions; the arrays hold the id
+of its first tag.
+"""
+import os
+import jsonio
+import random
+import numpy as np
+from fileio import open_file, find_file
+from pipeline import run_pipeline
+
+PAD = '<pad>'
+UNK = '<unk>'
+
+# BIO file -> name of its array in a batch
+label_files = {
+    'entity_BIO': 'entity',
+    'event_trigger_BIO': 'trigger',
+    'event_argument_BIO': 'argument'
+}
+
+
+def load_json_file(path):
+    with open_file(find_file(path)) as f:
+        return jsonio.loads(f.read())
+
+
+class BIODataset:
+    """Tokens and tags of one split, read from the `output/BIO/<split>/` files of build_BIO.py."""
+
+    def __init__(self, path):
+        self.tokens = load_json_file(os.path.join(path, 'token.json'))
+        self.labels = dict()
+        for file, name in label_files.items():
+            self.labels[name] = load_json_file(os.path.join(path, file + '.json'))
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+def build_vocab(datasets, min_count=1):
+    """Id mappings of tokens (with frequency at least `min_count`) and of every tag set."""
+    counts = dict()
+    label_sets = dict((name, set()) for name in label_files.values())
+    for dataset in datasets:
+        for sent in dataset.tokens:
+            for token in sent:
+                counts[token] = counts.get(token, 0) + 1
+        for name, labels in dataset.labels.items():
+            for sent in labels:
+                for tags in sent:
+                    label_sets[name].add(tags[0])
+    vocab = {'token': [PAD, UNK] + sorted(t for t, c in counts.items() if c >= min_count)}
+    for name, labels in label_sets.items():
+        # 'O' first so that padding and no-tag share id 0
+        vocab[name] = ['O'] + sorted(labels - {'O'})
+    return dict((name, dict((s, i) for i, s in enumerate(strings))) for name, strings in vocab.items())
+
+
+def load_vocab(path, datasets, min_count=1):
+    """Read the vocabulary cached at `path`, building and saving it from `datasets` the first time."""
+    if os.path.exists(path):
+        return load_json_file(path)
+    vocab = build_vocab(datasets, min_count)
+    with open_file(path, 'w') as f:
+        f.write(jsonio.dumps(vocab))
+    return vocab
+
+
+class BatchLoader:
+    """Iterate over length-bucketed, padded batches of a `BIODataset`.
+
+    Sentences are converted to id arrays once. Every epoch, sentences of similar length
+    (within `bucket_width` tokens) are grouped into batches so little padding is needed;
+    with `shuffle`, the sentences inside a bucket and the order of the batches are shuffled.
+    Batches are padded by a background thread, `prefetch` batches ahead.
+    """
+
+    def __init__(self, dataset, vocab, batch_size=32, bucket_width=5, shuffle=True, prefetch=4, seed=None):
+        self.batch_size = batch_size
+        self.bucket_width = bucket_width
+        self.shuffle = shuffle
+        self.prefetch = prefetch
+        self.rng = random.Random(seed)
+        unk = vocab['token'][UNK]
+        self.tokens = [np.array([vocab['token'].get(t, unk) for t in sent], dtype=np.int64)
+                       for sent in dataset.tokens]
+        self.labels = dict()
+        for name, labels in dataset.labels.items():
+            # tags not seen when the vocabulary was built map to 'O'
+            self.labels[name] = [np.array([vocab[name].get(tags[0], 0) for tags in sent], dtype=np.int64)
+                                 for sent in labels]
+        self.lengths = np.array([len(sent) for sent in self.tokens], dtype=np.int64)
+
+    def batches(self):
+        """Lists of sentence indices, one per batch."""
+        buckets = dict()
+        for idx, length in enumerate(self.lengths):
+            buckets.setdefault(int(length) // self.bucket_width, []).append(idx)
+        batches = []
+        for key in sorted(buckets):
+            indices = buckets[key]
+            if self.shuffle:
+                self.rng.shuffle(indices)
+            for i in range(0, len(indices), self.batch_size):
+                batches.append(indices[i:i + self.batch_size])
+        if self.shuffle:
+            self.rng.shuffle(batches)
+        return batches
+
+    def pad(self, indices):
+        lengths = self.lengths[indices]
+        max_len = int(lengths.max()) if len(indices) else 0
+        batch = {
+            'indices': np.array(indices, dtype=np.int64),
+            'lengths': lengths,
+            'mask': np.arange(max_len)[None, :] < lengths[:, None],
+            'tokens': np.zeros((len(indices), max_len), dtype=np.int64)
+        }
+        for name in self.labels:
+            batch[name] = np.zeros((len(indices), max_len), dtype=np.int64)
+        for row, idx in enumerate(indices):
+            batch['tokens'][row, :self.lengths[idx]] = self.tokens[idx]
+            for name, labels in self.labels.items():
+                batch[name][row, :self.lengths[idx]] = labels[idx]
+        return batch
+
+    def __len__(self):
+        sizes = np.bincount(self.lengths // self.bucket_width)
+        return int(sum((size + self.batch_size - 1) // self.batch_size for size in sizes))
+
+    def __iter__(self):
+        return run_pipeline(self.batches(), [self.pad], depth=self.prefetch)
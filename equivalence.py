@@ -0,0 +1,336 @@
+"""Differential check of the optimized code paths against the frozen code of reference.py.
+
+    python equivalence.py span --lang en [--synthetic 50]
+    python equivalence.py transform --lang en [--synthetic 50]
+    python equivalence.py tags --lang en [--synthetic 500]
+    python equivalence.py diff --kind v2|output|bio PATH_A PATH_B
+
+`span`, `transform` and `tags` run the reference and the current implementation of
+find_span_offset/find_subspan_offset, load_processed_data and get_entity_tag on the same
+inputs (the files in cache_data/ and output/, or a synthetic corpus) and report the
+mention-level mismatches and the reference/current timing ratio. `diff` compares the
+.v2.json, output/*.json or BIO files of two runs.
+"""
+import os
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from fileio import open_file, find_file
+from sentence import Sentence
+from tokenization import backends, load_tokenizer
+
+lang_name = {
+    'en': 'English',
+    'ar': 'Arabic',
+    'zh': 'Chinese'
+}
+
+# words exercising the fallbacks: sub-words, clitics, trailing punctuation
+synthetic_vocab = ['the', 'army', 'U.S.', 'Army', 'soldiers', 'in', 'Persian', 'Gulf', 'region', ',', '.',
+                   'israeli-palestinian', 'israeli', 'my', 'ex', "ex's", 'Nashville', 'Tenn', 'Tenn.', '17,000',
+                   'killed', 'people', 'were', 'at', 'least', '19', 'Tuesday', "'s", 'airport', 'blast']
+
+
+class Raised:
+    """Exception raised by one implementation, compared by type and printed as `raised <type>`."""
+
+    def __init__(self, error):
+        self.error = error
+
+    def __eq__(self, other):
+        return isinstance(other, Raised) and type(self.error) is type(other.error)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'raised {}: {}'.format(type(self.error).__name__, self.error)
+
+
+def call(fn, args, catch):
+    if not catch:
+        return fn(*args)
+    try:
+        return fn(*args)
+    except Exception as error:
+        return Raised(error)
+
+
+class Report:
+    def __init__(self, name, max_report=20):
+        self.name = name
+        self.max_report = max_report
+        self.compared = 0
+        self.mismatches = 0
+        self.ref_time = 0.
+        self.alt_time = 0.
+
+    def compare(self, key, reference, current):
+        self.compared += 1
+        if reference != current:
+            self.mismatches += 1
+            if self.mismatches <= self.max_report:
+                print('[{}] mismatch at {}:\n    reference: {}\n    current:   {}'.format(
+                    self.name, key, reference, current))
+
+    def timed(self, reference_fn, current_fn, *args, catch=False):
+        """Results of both implementations on `args`; with `catch`, an exception is returned as `Raised`."""
+        start = time.time()
+        reference = call(reference_fn, args, catch)
+        self.ref_time += time.time() - start
+        start = time.time()
+        current = call(current_fn, args, catch)
+        self.alt_time += time.time() - start
+        return reference, current
+
+    def print(self):
+        ratio = self.ref_time / self.alt_time if self.alt_time > 0 else float('inf')
+        print('[{}] compared {}, mismatches {}, reference {:.2f}s, current {:.2f}s, speedup {:.2f}x'.format(
+            self.name, self.compared, self.mismatches, self.ref_time, self.alt_time, ratio))
+
+
+def synthetic_document(rng, num_sentences):
+    """Random sentences with consistent character offsets, as `load_conllu` returns them."""
+    sentences = []
+    text = ''
+    for idx in range(num_sentences):
+        words = [rng.choice(synthetic_vocab) for _ in range(rng.randint(3, 25))]
+        sent = Sentence(str(idx + 1), ' '.join(words))
+        for word in words:
+            sent.append(word, 'X', 0, 'dep', len(text), len(text) + len(word))
+            text += word + ' '
+        text = text[:-1] + '\n'
+        sentences.append(sent.freeze())
+    return sentences, text
+
+
+def synthetic_mentions(rng, sentences, text, num_mentions):
+    """Mentions in APF convention (inclusive end) with the offset and boundary noise seen in ACE."""
+    mentions = []
+    for _ in range(num_mentions):
+        sent = rng.choice(sentences)
+        start = rng.randrange(len(sent))
+        end = min(len(sent) - 1, start + rng.randint(0, 4))
+        char_start = sent.starts[start] + rng.choice([0, 0, 0, -1, 1, 2])
+        char_end = sent.ends[end] - 1 + rng.choice([0, 0, 0, -1, 1, -2])
+        char_start = max(0, min(char_start, char_end))
+        head = rng.randint(start, end)
+        mentions.append({
+            'text': text[char_start:char_end + 1],
+            'position': [char_start, char_end],
+            'head': {'text': sent.words[head], 'position': [sent.starts[head], sent.ends[head] - 1]}
+        })
+    return mentions
+
+
+def iter_documents(opt):
+    """(name, sentences, mentions) of the cache_data documents, or of a synthetic corpus."""
+    from extract import get_file_names, load_conllu, load_json
+    if opt.synthetic:
+        rng = random.Random(opt.seed)
+        for idx in range(opt.synthetic):
+            sentences, text = synthetic_document(rng, rng.randint(1, 30))
+            yield 'synthetic-{}'.format(idx), sentences, synthetic_mentions(rng, sentences, text, 40)
+        return
+    target_dir = os.path.join(opt.data, lang_name[opt.lang])
+    for filename in get_file_names(target_dir):
+        sentences = load_conllu(os.path.join(target_dir, '{}.conllu'.format(filename)))
+        v1 = load_json(os.path.join(target_dir, '{}.v1.json'.format(filename)))
+        mentions = [m for m in v1['entities'] if m['entity-type'] != 'TIM:time']
+        mentions += [dict(m, head=m['trigger']) for m in v1['events']]
+        mentions += v1['relations']
+        yield filename, sentences, mentions
+
+
+def span_result(result):
+    if isinstance(result, Raised):
+        return result
+    return result['sent_id'], result['start'], result['end']
+
+
+def check_span(opt):
+    """Compare the alignment of every mention; an exception of either implementation is a mismatch."""
+    import reference
+    import extract
+    model = load_tokenizer(opt.tokenizer, opt.lang, extract.model_map[opt.lang])
+    span_report = Report('find_span_offset', opt.max_report)
+    subspan_report = Report('find_subspan_offset', opt.max_report)
+    for name, sentences, mentions in iter_documents(opt):
+        for idx, mention in enumerate(mentions):
+            args = (sentences, mention['text'], mention['position'][0], mention['position'][1], model, opt.lang)
+            ref, cur = span_report.timed(reference.find_span_offset, extract.find_span_offset, *args, catch=True)
+            span_report.compare('{} mention {} {!r}'.format(name, idx, mention['text']),
+                                span_result(ref), span_result(cur))
+            if isinstance(ref, Raised) or isinstance(cur, Raised) or ref['start'] == -1 or cur['start'] == -1 \
+                    or 'head' not in mention:
+                continue
+            args = (ref['best_sent'], [ref['start'], ref['end']], mention['head']['text'],
+                    mention['head']['position'][0], mention['head']['position'][1], model)
+            ref, cur = subspan_report.timed(reference.find_subspan_offset, extract.find_subspan_offset, *args,
+                                            catch=True)
+            subspan_report.compare('{} mention {} head {!r}'.format(name, idx, mention['head']['text']), ref, cur)
+    span_report.print()
+    subspan_report.print()
+    return span_report.mismatches + subspan_report.mismatches
+
+
+def write_synthetic_cache(opt, root):
+    """Write a synthetic cache_data/ tree below `root`, return the file list of each split."""
+    rng = random.Random(opt.seed)
+    file_lists = dict()
+    outdir = os.path.join(root, 'cache_data', lang_name[opt.lang])
+    os.makedirs(outdir)
+    for split in ['train', 'dev', 'test']:
+        file_lists[split] = []
+        for idx in range(opt.synthetic):
+            filename = '{}-{}'.format(split, idx)
+            sentences, text = synthetic_document(rng, rng.randint(1, 30))
+            with open(os.path.join(outdir, filename + '.conllu'), 'w', encoding='utf-8') as fw:
+                for sent in sentences:
+                    fw.write('# sent_id = {}\n# text = {}\n'.format(sent.id, sent.text))
+                    for widx, word in enumerate(sent.words):
+                        fw.write('{}\t{}\t_\tX\t_\t_\t0\tdep\t_\tTokenRange={}:{}\n'.format(
+                            widx + 1, word, sent.starts[widx], sent.ends[widx]))
+                    fw.write('\n')
+            v2 = {'entities': [], 'events': [], 'relations': []}
+            for key, id_key in [('entities', 'entity-id'), ('events', 'event-id'), ('relations', 'relation-id')]:
+                for _ in range(rng.randint(0, 20)):
+                    sent = rng.choice(sentences)
+                    start = rng.randrange(len(sent))
+                    v2[key].append({id_key: '{}-{}-{}'.format(filename, key, len(v2[key])),
+                                    'sent_id': sent.id, 'position': [start, start]})
+            with open(os.path.join(outdir, filename + '.v2.json'), 'w', encoding='utf-8') as fw:
+                json.dump(v2, fw)
+            file_lists[split].append(filename)
+    return file_lists
+
+
+def check_transform(opt):
+    import reference
+    import transform
+    report = Report('load_processed_data', opt.max_report)
+    language = lang_name[opt.lang]
+    cwd = os.getcwd()
+    tmpdir = None
+    if opt.synthetic:
+        tmpdir = tempfile.mkdtemp()
+        file_lists = write_synthetic_cache(opt, tmpdir)
+        os.chdir(tmpdir)
+    else:
+        file_lists = dict((split, transform.load_file_list(opt.lang, split)) for split in ['train', 'dev', 'test'])
+    try:
+        for split, file_list in file_lists.items():
+            ref, cur = report.timed(reference.load_processed_data, transform.load_processed_data,
+                                    file_list, language)
+            report.compare('{} #sentences'.format(split), len(ref), len(cur))
+            for idx, (ref_sent, cur_sent) in enumerate(zip(ref, cur)):
+                for key in sorted(set(ref_sent) | set(cur_sent)):
+                    report.compare('{} sentence {} {}'.format(split, idx, key), ref_sent.get(key), cur_sent.get(key))
+    finally:
+        os.chdir(cwd)
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+    report.print()
+    return report.mismatches
+
+
+def check_tags(opt):
+    import reference
+    import build_BIO
+    report = Report('get_entity_tag', opt.max_report)
+    datasets = []
+    if opt.synthetic:
+        rng = random.Random(opt.seed)
+        raw_data = []
+        for _ in range(opt.synthetic):
+            num_tokens = rng.randint(1, 40)
+            entities = []
+            for _ in range(rng.randint(0, 8)):
+                start = rng.randrange(num_tokens)
+                end = min(num_tokens - 1, start + rng.randint(0, 5))
+                entities.append({'entity-type': rng.choice(['PER:Individual', 'ORG:Government', 'GPE:Nation']),
+                                 'position': [start, end]})
+            raw_data.append({'tokens': ['w'] * num_tokens, 'golden-entity-mentions': entities})
+        datasets.append(('synthetic', raw_data))
+    else:
+        for split in ['train', 'dev', 'test']:
+            path = find_file(os.path.join(opt.output, '{}-{}.json'.format(opt.lang, split)))
+            with open_file(path) as f:
+                datasets.append((split, json.loads(f.read())))
+    for name, raw_data in datasets:
+        ref, cur = report.timed(reference.get_entity_tag, build_BIO.get_entity_tag, raw_data)
+        for idx, (ref_sent, cur_sent) in enumerate(zip(ref, cur)):
+            report.compare('{} sentence {}'.format(name, idx), ref_sent, cur_sent)
+    report.print()
+    return report.mismatches
+
+
+def load(path):
+    with open_file(find_file(path)) as f:
+        return json.loads(f.read())
+
+
+def mention_key(mention):
+    for key in ['entity-id', 'event-id', 'relation-id']:
+        if key in mention:
+            return mention[key]
+    return json.dumps(mention, sort_keys=True)
+
+
+def compare_mentions(report, where, ref_mentions, cur_mentions):
+    ref_by_id = dict((mention_key(m), m) for m in ref_mentions)
+    cur_by_id = dict((mention_key(m), m) for m in cur_mentions)
+    for key in sorted(set(ref_by_id) | set(cur_by_id)):
+        report.compare('{} {}'.format(where, key), ref_by_id.get(key), cur_by_id.get(key))
+
+
+def diff_files(opt):
+    report = Report('diff ' + opt.kind, opt.max_report)
+    a, b = opt.paths
+    if opt.kind == 'v2':
+        ref, cur = load(a), load(b)
+        for key in ['entities', 'events', 'relations']:
+            compare_mentions(report, key, ref[key], cur[key])
+    elif opt.kind == 'output':
+        ref, cur = load(a), load(b)
+        report.compare('#sentences', len(ref), len(cur))
+        for idx, (ref_sent, cur_sent) in enumerate(zip(ref, cur)):
+            report.compare('sentence {} tokens'.format(idx), ref_sent['tokens'], cur_sent['tokens'])
+            for key in ['golden-entity-mentions', 'golden-event-mentions', 'golden-relation-mentions']:
+                compare_mentions(report, 'sentence {} {}'.format(idx, key), ref_sent[key], cur_sent[key])
+    else:
+        for name in ['token', 'entity_BIO', 'event_trigger_BIO', 'event_argument_BIO']:
+            ref = load(os.path.join(a, name + '.json'))
+            cur = load(os.path.join(b, name + '.json'))
+            report.compare('{} #sentences'.format(name), len(ref), len(cur))
+            for idx, (ref_sent, cur_sent) in enumerate(zip(ref, cur)):
+                report.compare('{} sentence {}'.format(name, idx), ref_sent, cur_sent)
+    report.print()
+    return report.mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('check', choices=['span', 'transform', 'tags', 'diff'])
+    parser.add_argument('paths', nargs='*', help="The two files (directories for bio) compared by `diff`")
+    parser.add_argument('--lang', type=str, help="Name of the language", default='en',
+                        choices=['en', 'ar', 'zh'])
+    parser.add_argument('--data', type=str, default='./cache_data/', help="Path of the cached data")
+    parser.add_argument('--output', type=str, default='./output/', help="Path of the transform output")
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help="Check a synthetic corpus of this many documents/sentences instead of the real data")
+    parser.add_argument('--seed', type=int, default=1, help="Seed of the synthetic corpus")
+    parser.add_argument('--kind', type=str, default='v2', choices=['v2', 'output', 'bio'],
+                        help="Type of the files compared by `diff`")
+    parser.add_argument('--max-report', type=int, default=20, help="Number of mismatches printed")
+    parser.add_argument('--tokenizer', type=str, default='udpipe', choices=backends,
+                        help="Tokenizer backend of the alignment fallbacks compared by `span`")
+    args = parser.parse_args()
+    if args.check == 'diff' and len(args.paths) != 2:
+        parser.error('diff needs two paths')
+    checks = {'span': check_span, 'transform': check_transform, 'tags': check_tags, 'diff': diff_files}
+    mismatches = checks[args.check](args)
+    exit(1 if mismatches else 0)
@@ -1,11 +1,21 @@
 import os
-import json
+import jsonio
 import string
+import hashlib
+import inspect
 import argparse
-from conllu import parse
+import threading
 from collections import OrderedDict
 from tqdm import tqdm
-from udpipe import Model
+from tokenization import backends, load_tokenizer
+from sentence import Sentence
+from conllu_reader import iter_conllu, is_word, token_range
+from pipeline import run_pipeline, BackgroundWriter
+from scheduler import run_scheduled
+from profiling import Profiler
+from fileio import open_file, find_file, compressed_name, strip_compression, tmp_prefix
+from checkpoint import Journal, remove_partial_files
+from align_cache import AlignmentCache, document_fingerprint
 
 model_map = {
     'en': 'udpipe/english-ewt-ud-2.5-191206.udpipe',
@@ -20,59 +30,70 @@ lang_name = {
 }
 
 
+# tokenizers (UDPipe models) shared by all pipeline threads of the process
+model_cache = dict()
+model_cache_lock = threading.Lock()
+
+
+def get_model(lang, backend='udpipe'):
+    """Load the tokenizer `backend` of `lang` once per process."""
+    with model_cache_lock:
+        if (backend, lang) not in model_cache:
+            model_cache[(backend, lang)] = load_tokenizer(backend, lang, model_map[lang])
+        return model_cache[(backend, lang)]
+
+
+class LazyModel:
+    """Stands for the tokenizer of `lang`, which is only loaded when a tokenization fallback first needs it."""
+
+    def __init__(self, lang, backend='udpipe'):
+        self.lang = lang
+        self.backend = backend
+
+    def __getattr__(self, name):
+        return getattr(get_model(self.lang, self.backend), name)
+
+
 def get_file_names(dirpath):
     filenames = []
-    for file in os.listdir(dirpath):
-        if file.endswith(".conllu"):
+    for file in sorted(os.listdir(dirpath)):
+        file = strip_compression(file)
+        if file.endswith(".conllu") and not file.startswith(tmp_prefix):
             filenames.append(os.path.splitext(file)[0])
-    return filenames
+    # a document is listed once even if its .conllu exists in several compressions
+    return list(OrderedDict.fromkeys(filenames))
 
 
 def load_json(json_file):
-    with open(json_file) as f:
-        data = json.load(f)
+    with open_file(find_file(json_file)) as f:
+        data = jsonio.load(f)
     return data
 
 
 def load_conllu(conllu_file):
     conllu_data = []
-    with open(conllu_file, 'r', encoding='utf-8') as content_file:
-        content = content_file.read()
-        sentences = parse(content)
-        for idx, sentence in enumerate(sentences):
-            tokens, upos, head, deprel, offset = [], [], [], [], []
+    with open_file(find_file(conllu_file), 'r', encoding='utf-8') as content_file:
+        for sentence in iter_conllu(content_file, ['form', 'upos', 'head', 'deprel', 'misc']):
+            sent_obj = Sentence(sentence.metadata['sent_id'], sentence.metadata['text'])
+            forms, upos, heads, deprels, miscs = [sentence.columns[name]
+                                                  for name in ['form', 'upos', 'head', 'deprel', 'misc']]
             reserved_offsets = []
-            for widx, word in enumerate(sentence):
-                if isinstance(word['id'], tuple):
-                    # multi-word token, e.g., word['id'] = (4, '-', 5)
-                    assert len(word['id']) == 3
-                    indices = word['misc']['TokenRange'].split(':')
-                    reserved_offsets.append([int(indices[0]), int(indices[1])])
+            for widx, word_id in enumerate(sentence.ids):
+                if not is_word(word_id):
+                    # multi-word token, e.g., 4-5
+                    reserved_offsets.append(token_range(miscs[widx]))
                 else:
-                    tokens.append(word['form'])
-                    upos.append(word['upostag'])
-                    head.append(word['head'])
-                    deprel.append(word['deprel'])
-                    if word['misc'] is not None:
+                    if miscs[widx] != '_':
                         # single-word token
-                        indices = word['misc']['TokenRange'].split(':')
-                        offset.append([int(indices[0]), int(indices[1])])
+                        offset = token_range(miscs[widx])
                     elif len(reserved_offsets) > 0:
-                        offset.append(reserved_offsets.pop())
+                        offset = reserved_offsets.pop()
                     else:
-                        offset.append([-1, -1])
-
-            assert len(tokens) == len(offset)
-            sent_obj = OrderedDict([
-                ('id', sentence.metadata['sent_id']),
-                ('text', sentence.metadata['text']),
-                ('word', tokens),
-                ('upos', upos),
-                ('head', head),
-                ('deprel', deprel),
-                ('offset', offset)
-            ])
-            conllu_data.append(sent_obj)
+                        offset = [-1, -1]
+                    sent_obj.append(forms[widx], upos[widx], None if heads[widx] == '_' else int(heads[widx]),
+                                    deprels[widx], offset[0], offset[1])
+
+            conllu_data.append(sent_obj.freeze())
 
     return conllu_data
 
@@ -86,17 +107,63 @@ def compare_string_without_space(src_words, tgt_words, ignore_punc=False):
     return src_chars == tgt_chars
 
 
+def tokenize_words(model, text):
+    tokenized_text = model.tokenize(text, 'ranges')
+    conllu = model.write(tokenized_text, "conllu")
+    return [form for sent in iter_conllu(conllu.split('\n')) for form in sent.columns['form']]
+
+
+def find_tokenized_windows(words, text_len, tokenized_text):
+    """Find every window of `text_len` words whose joined text contains `tokenized_text`.
+
+    The words are joined once and all occurrences of `tokenized_text` are located in
+    that string; a char-position -> token-index map then turns each occurrence into
+    the range of window starts that cover it. Returns the sorted window starts, [] for
+    an empty `tokenized_text`, or None if `tokenized_text` does not occur in the joined
+    words at all.
+    """
+    if not tokenized_text:
+        # a text without words (e.g. only whitespace) is not matched; the original window
+        # loop matched every window including the one past the last word and then failed
+        # with an IndexError on its offset
+        return []
+    joined = ' '.join(words)
+    pos = joined.find(tokenized_text)
+    if pos == -1:
+        return None
+
+    char_token = []
+    token_end = []
+    for i, word in enumerate(words):
+        char_token.extend([i] * (len(word) + 1))  # the word and its trailing space
+        token_end.append(len(char_token) - 1)
+
+    # a window also matches when the text is only part of it, e.g.,
+    # `my ex` in `my ex's`, `Nashville , Tenn` in `Nashville , Tenn.`
+    window_starts = set()
+    last_start = len(words) - text_len
+    text_chars = len(tokenized_text)
+    while pos != -1 and text_chars > 0:
+        first = char_token[pos]
+        last = char_token[pos + text_chars - 1]
+        if token_end[last] < pos + text_chars:
+            # the occurrence ends on the space after `last`
+            last += 1
+        for i in range(max(0, last - text_len + 1), min(first, last_start) + 1):
+            window_starts.add(i)
+        pos = joined.find(tokenized_text, pos + 1)
+
+    return sorted(window_starts)
+
+
 def find_span_offset(sentences, text, text_start, text_end, model, lang):
     match_positions = [-1, -1]
     type_of_match_found = ''
     best_sent_id = None
     best_sent = None
 
-    tokenized_text = model.tokenize(text, 'ranges')
-    conllu = parse(model.write(tokenized_text, "conllu"))
-    text_words = [w['form'] for sent in conllu for w in sent]
-    text_len = len(text_words)
-    tokenized_text = ' '.join(text_words)
+    # tokenized only when a strategy needs it, many mentions never do
+    text_words = None
 
     for sent in sentences:
         best_sent = sent
@@ -116,6 +183,8 @@ def find_span_offset(sentences, text, text_start, text_end, model, lang):
                 if start[0] <= end[0]:
                     ent_words = sent['word'][start[0]:end[0] + 1]
                     # we make sure that the character sequence without space matches
+                    if text_words is None:
+                        text_words = tokenize_words(model, text)
                     if compare_string_without_space(text_words, ent_words):
                         type_of_match_found = 'exact_first'
                         match_positions = [start[0], end[0]]
@@ -134,6 +203,8 @@ def find_span_offset(sentences, text, text_start, text_end, model, lang):
             if len(start) == 1 and len(end) == 1:
                 if start[0] <= end[0]:
                     ent_words = sent['word'][start[0]:end[0] + 1]
+                    if text_words is None:
+                        text_words = tokenize_words(model, text)
                     if compare_string_without_space(text_words, ent_words):
                         type_of_match_found = 'exact_second'
                         match_positions = [start[0], end[0]]
@@ -185,30 +256,17 @@ def find_span_offset(sentences, text, text_start, text_end, model, lang):
                 break
 
             # let's try to match the target text with its' tokenized form
-            tokenized_text_len = len(tokenized_text)
-            tokenized_sent_text = ' '.join(sent['word'])
-
-            if tokenized_text in tokenized_sent_text:
+            if text_words is None:
+                text_words = tokenize_words(model, text)
+            text_len = len(text_words)
+            tokenized_text = ' '.join(text_words)
+            window_starts = find_tokenized_windows(sent['word'], text_len, tokenized_text)
+            if window_starts is not None:
                 matches = []
                 match_dist = []
-                for i in range(len(sent['word']) - text_len + 1):
-                    match_found = False
-                    selected_text = ' '.join(sent['word'][i: i + text_len])
-                    if sent['word'][i: i + text_len] == text_words:
-                        type_of_match_found = 'tokenized_text_match'
-                        match_found = True
-                    elif tokenized_text in selected_text:
-                        # so, there are matches such as: `my ex` in `my ex's`
-                        # `Nashville , Tenn` in `Nashville , Tenn.`
-                        selected_text = ' '.join(sent['word'][i: i + text_len])
-                        selected_text_len = len(selected_text)
-                        for j in range(selected_text_len - tokenized_text_len + 1):
-                            if selected_text[j:j + tokenized_text_len] == tokenized_text:
-                                type_of_match_found = 'tokenized_partial_text_match'
-                                match_found = True
-                    if match_found:
-                        matches.append([i, i + text_len - 1])
-                        match_dist.append(abs(offsets[i][0] - text_start))
+                for i in window_starts:
+                    matches.append([i, i + text_len - 1])
+                    match_dist.append(abs(offsets[i][0] - text_start))
 
                 if len(matches) > 0:
                     if len(matches) == 1:
@@ -287,36 +345,19 @@ def find_subspan_offset(sent, offset, text, text_start, text_end, model):
         return sub_word_matches[index]
 
     # let's try to match the target text with its' tokenized form
-    tokenized_text = model.tokenize(text, 'ranges')
-    conllu = parse(model.write(tokenized_text, "conllu"))
-    text_words = [w['form'] for sent in conllu for w in sent]
+    text_words = tokenize_words(model, text)
     text_len = len(text_words)
     tokenized_text = ' '.join(text_words)
-    tokenized_text_len = len(tokenized_text)
 
     entity_words = sent['word'][ent_start: ent_end + 1]
-    tokenized_sent_text = ' '.join(entity_words)
-
-    if tokenized_text in tokenized_sent_text:
+    window_starts = find_tokenized_windows(entity_words, text_len, tokenized_text)
+    if window_starts is not None:
         matches = []
         match_dist = []
-        for i in range(len(entity_words) - text_len + 1):
+        for i in window_starts:
             offset = sent['offset'][i]
-            match_found = False
-            selected_text = ' '.join(entity_words[i: i + text_len])
-            if entity_words[i: i + text_len] == text_words:
-                match_found = True
-            elif tokenized_text in selected_text:
-                # so, there are matches such as: `my ex` in `my ex's`
-                # `Nashville , Tenn` in `Nashville , Tenn.`
-                selected_text = ' '.join(entity_words[i: i + text_len])
-                selected_text_len = len(selected_text)
-                for j in range(selected_text_len - tokenized_text_len + 1):
-                    if selected_text[j:j + tokenized_text_len] == tokenized_text:
-                        match_found = True
-            if match_found:
-                matches.append([i + ent_start, i + ent_start + text_len - 1])
-                match_dist.append(abs(offset[0] - text_start))
+            matches.append([i + ent_start, i + ent_start + text_len - 1])
+            match_dist.append(abs(offset[0] - text_start))
 
         if len(matches) > 0:
             if len(matches) == 1:
@@ -328,6 +369,61 @@ def find_subspan_offset(sent, offset, text, text_start, text_end, model):
     return [-1, -1]
 
 
+def alignment_version(backend, lang):
+    """Hash of the alignment code and of the tokenizer of its fallbacks, part of the cache fingerprints.
+
+    The tokenizer is the backend and `lang`, and for udpipe the model file: its path and,
+    when it is on disk, its size and modification time, so a new model drops the results.
+    """
+    h = hashlib.sha1('{}\t{}'.format(backend, lang).encode('utf-8'))
+    if backend == 'udpipe':
+        model_path = model_map[lang]
+        h.update(model_path.encode('utf-8'))
+        if os.path.exists(model_path):
+            stat = os.stat(model_path)
+            h.update('\t{}\t{}'.format(stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+    for fn in [compare_string_without_space, tokenize_words, find_tokenized_windows, find_span_offset,
+               find_subspan_offset]:
+        h.update(inspect.getsource(fn).encode('utf-8'))
+    return h.hexdigest()
+
+
+def align_span(cache, sentences, text, text_start, text_end, model, lang):
+    """`find_span_offset` through the alignment cache of the document, if any."""
+    if cache is None:
+        return find_span_offset(sentences, text, text_start, text_end, model, lang)
+    key = cache.key('span', lang, text_start, text_end, text)
+    value = cache.get(key)
+    if value is None:
+        offset = find_span_offset(sentences, text, text_start, text_end, model, lang)
+        sent_idx = None
+        for idx, sent in enumerate(sentences):
+            if sent is offset['best_sent']:
+                sent_idx = idx
+        cache.put(key, [sent_idx, offset['start'], offset['end']])
+        return offset
+    sent_idx, start, end = value
+    best_sent = None if sent_idx is None else sentences[sent_idx]
+    return {
+        'best_sent': best_sent,
+        'sent_id': None if best_sent is None else best_sent['id'],
+        'start': start,
+        'end': end
+    }
+
+
+def align_subspan(cache, sent, offset, text, text_start, text_end, model):
+    """`find_subspan_offset` through the alignment cache of the document, if any."""
+    if cache is None:
+        return find_subspan_offset(sent, offset, text, text_start, text_end, model)
+    key = cache.key('subspan', sent['id'], offset[0], offset[1], text_start, text_end, text)
+    value = cache.get(key)
+    if value is None:
+        value = find_subspan_offset(sent, offset, text, text_start, text_end, model)
+        cache.put(key, list(value))
+    return list(value)
+
+
 # An Entity example is as follows.
 # {
 # 	"entity-id": "AFP_ENG_20030304.0250-E1-3",
@@ -339,7 +435,7 @@ def find_subspan_offset(sent, offset, text, text_start, text_end, model):
 # 		"position": [497, 516]
 # 	}
 # }
-def correct_entities(list_of_entity, sentences, lang, model):
+def correct_entities(list_of_entity, sentences, lang, model, cache=None):
     corrected_entities = []
     skipped, dropped, wrong_head = 0, 0, 0
     for entity in list_of_entity:
@@ -350,19 +446,19 @@ def correct_entities(list_of_entity, sentences, lang, model):
         new_entity['entity-id'] = entity['entity-id']
         new_entity['entity-type'] = entity['entity-type']
         new_entity['text'] = entity['text']
-        entity_offset = find_span_offset(sentences,
-                                         entity['text'],
-                                         entity['position'][0],
-                                         entity['position'][1],
-                                         model, lang)
+        entity_offset = align_span(cache, sentences,
+                                   entity['text'],
+                                   entity['position'][0],
+                                   entity['position'][1],
+                                   model, lang)
         if entity_offset['start'] != -1:
-            head_offset = find_subspan_offset(entity_offset['best_sent'],
-                                              [entity_offset['start'],
-                                               entity_offset['end']],
-                                              entity['head']['text'],
-                                              entity['head']['position'][0],
-                                              entity['head']['position'][1],
-                                              model)
+            head_offset = align_subspan(cache, entity_offset['best_sent'],
+                                        [entity_offset['start'],
+                                         entity_offset['end']],
+                                        entity['head']['text'],
+                                        entity['head']['position'][0],
+                                        entity['head']['position'][1],
+                                        model)
             if head_offset[0] != -1:
                 if head_offset[0] < entity_offset['start'] or \
                         head_offset[0] > entity_offset['end']:
@@ -423,7 +519,7 @@ def correct_entities(list_of_entity, sentences, lang, model):
 # 		"position": [205, 210]
 # 	}
 # }
-def correct_events(list_of_events, list_of_entities, sentences, lang, model):
+def correct_events(list_of_events, list_of_entities, sentences, lang, model, cache=None):
     entities = dict()
     for entity in list_of_entities:
         entities[entity['entity-id']] = entity
@@ -447,20 +543,20 @@ def correct_events(list_of_events, list_of_entities, sentences, lang, model):
                 })
 
         new_event['text'] = event['text']
-        event_offset = find_span_offset(sentences,
-                                        event['text'],
-                                        event['position'][0],
-                                        event['position'][1],
-                                        model, lang)
+        event_offset = align_span(cache, sentences,
+                                  event['text'],
+                                  event['position'][0],
+                                  event['position'][1],
+                                  model, lang)
 
         if event_offset['start'] != -1:
-            trigger_offset = find_subspan_offset(event_offset['best_sent'],
-                                                 [event_offset['start'],
-                                                  event_offset['end']],
-                                                 event['trigger']['text'],
-                                                 event['trigger']['position'][0],
-                                                 event['trigger']['position'][1],
-                                                 model)
+            trigger_offset = align_subspan(cache, event_offset['best_sent'],
+                                           [event_offset['start'],
+                                            event_offset['end']],
+                                           event['trigger']['text'],
+                                           event['trigger']['position'][0],
+                                           event['trigger']['position'][1],
+                                           model)
 
             if trigger_offset[0] != -1:
                 if trigger_offset[0] < event_offset['start'] or \
@@ -490,7 +586,7 @@ def correct_events(list_of_events, list_of_entities, sentences, lang, model):
     return corrected_events, dropped, wrong_trigger
 
 
-def correct_relations(list_of_relations, list_of_entities, sentences, lang, model):
+def correct_relations(list_of_relations, list_of_entities, sentences, lang, model, cache=None):
     entities = dict()
     for entity in list_of_entities:
         entities[entity['entity-id']] = entity
@@ -503,11 +599,11 @@ def correct_relations(list_of_relations, list_of_entities, sentences, lang, mode
         new_relation['relation-type'] = relation['relation-type']
         new_relation['text'] = relation['text']
 
-        relation_offset = find_span_offset(sentences,
-                                           relation['text'],
-                                           relation['position'][0],
-                                           relation['position'][1],
-                                           model, lang)
+        relation_offset = align_span(cache, sentences,
+                                     relation['text'],
+                                     relation['position'][0],
+                                     relation['position'][1],
+                                     model, lang)
 
         if relation_offset['start'] != -1:
             new_relation['sent_id'] = relation_offset['sent_id']
@@ -530,65 +626,161 @@ def correct_relations(list_of_relations, list_of_entities, sentences, lang, mode
     return corrected_relations, dropped
 
 
-def modify_files(opt, split):
-    target_dir = os.path.join(opt.data, split)
+# hash of the alignment code per tokenizer backend and language, computed once per process
+alignment_versions = dict()
+
+
+def read_document(target_dir, filename, lang, backend=None):
+    """Sentences and mentions of a document and, with the tokenizer `backend`, its alignment cache."""
+    sentences = load_conllu(os.path.join(target_dir, '{}.conllu'.format(filename)))
+    jsonObj = load_json(os.path.join(target_dir, '{}.v1.json'.format(filename)))
+    cache = None
+    if backend is not None:
+        if (backend, lang) not in alignment_versions:
+            alignment_versions[(backend, lang)] = alignment_version(backend, lang)
+        cache = AlignmentCache.load(os.path.join(target_dir, '{}.align.json'.format(filename)),
+                                    document_fingerprint(sentences, alignment_versions[(backend, lang)]))
+    return filename, sentences, jsonObj, cache
+
+
+def expect_mention_texts(model, jsonObj):
+    """Announce the texts the alignment fallbacks may tokenize to the annotation daemon client,
+    which then tokenizes all of them in one request when the first fallback runs."""
+    texts = [m['text'] for key in ['entities', 'events', 'relations'] for m in jsonObj[key]]
+    texts += [m['head']['text'] for m in jsonObj['entities']]
+    texts += [m['trigger']['text'] for m in jsonObj['events']]
+    model.expect(texts)
+
+
+def align_document(item, lang, model):
+    filename, sentences, jsonObj, cache = item
+    if getattr(model, 'backend', None) == 'udpipe' and os.environ.get('UDPIPE_SOCKET'):
+        expect_mention_texts(model, jsonObj)
+    entities = correct_entities(jsonObj['entities'], sentences, lang, model, cache)
+    events = correct_events(jsonObj['events'], entities[0], sentences, lang, model, cache)
+    relations = correct_relations(jsonObj['relations'], entities[0], sentences, lang, model, cache)
+    return filename, jsonObj, entities, events, relations, cache
+
+
+# model of a worker process of `--workers`
+worker_model = None
+
+
+def init_worker(lang, backend):
+    global worker_model
+    if worker_model is None:
+        worker_model = LazyModel(lang, backend)
+
+
+def process_document(task):
+    target_dir, lang, filename, backend = task
+    return align_document(read_document(target_dir, filename, lang, backend), lang, worker_model)
+
+
+# rough size of one mention in a .v1.json
+mention_bytes = 300
+
+
+def document_cost(target_dir, filename):
+    """Estimated alignment cost from the file sizes only: every mention is searched through the
+    sentences of the document."""
+    conllu_file = find_file(os.path.join(target_dir, '{}.conllu'.format(filename)))
+    json_file = find_file(os.path.join(target_dir, '{}.v1.json'.format(filename)))
+    return os.path.getsize(conllu_file) * (1 + os.path.getsize(json_file) // mention_bytes)
+
+
+def modify_files(opt):
+    target_dir = opt.data
     filenames = get_file_names(target_dir)
-    ent, ent_dropped, ent_skipped, ent_wrong_head = 0, 0, 0, 0
-    eve, eve_dropped, eve_wrong_trigger = 0, 0, 0
-    rel, rel_dropped = 0, 0
-    model = Model(model_map[opt.lang])
-    for filename in tqdm(filenames, total=len(filenames)):
-        sentences = load_conllu(os.path.join(target_dir, '{}.conllu'.format(filename)))
-        jsonObj = load_json(os.path.join(target_dir, '{}.v1.json'.format(filename)))
-
-        modified_entities, dropped, skipped, wrong_head = correct_entities(jsonObj['entities'],
-                                                                           sentences,
-                                                                           opt.lang,
-                                                                           model)
-        ent_dropped += dropped
-        ent_skipped += skipped
-        ent_wrong_head += wrong_head
-        ent += len(jsonObj['entities'])
-
-        modified_events, dropped, wrong_trigger = correct_events(jsonObj['events'],
-                                                                 modified_entities,
-                                                                 sentences,
-                                                                 opt.lang,
-                                                                 model)
-        eve_dropped += dropped
-        eve_wrong_trigger += wrong_trigger
-        eve += len(jsonObj['events'])
-
-        modified_relations, dropped = correct_relations(jsonObj['relations'],
-                                                        modified_entities,
-                                                        sentences,
-                                                        opt.lang,
-                                                        model)
-        rel_dropped += dropped
-        rel += len(jsonObj['relations'])
-
-        with open(os.path.join(target_dir, '{}.v2.json'.format(filename)), 'w') as fw:
-            json.dump(OrderedDict([
+    remove_partial_files(target_dir)
+    counts = OrderedDict([
+        ('ent', 0), ('ent_dropped', 0), ('ent_skipped', 0), ('ent_wrong_head', 0),
+        ('eve', 0), ('eve_dropped', 0), ('eve_wrong_trigger', 0),
+        ('rel', 0), ('rel_dropped', 0)
+    ])
+    model = LazyModel(opt.lang, opt.tokenizer)
+
+    def output_file(filename):
+        return compressed_name(os.path.join(target_dir, '{}.v2.json'.format(filename)), opt.compress)
+
+    # tokenizer backend the alignment results are cached for, None without the cache
+    cache_backend = None if opt.no_align_cache else opt.tokenizer
+    hits, misses = 0, 0
+
+    def cache_file(filename):
+        return compressed_name(os.path.join(target_dir, '{}.align.json'.format(filename)), opt.compress)
+
+    def read(filename):
+        return read_document(target_dir, filename, opt.lang, cache_backend)
+
+    def align(item):
+        return align_document(item, opt.lang, model)
+    align = opt.profiler.wrap_document(align, key=lambda item: item[0])
+
+    journal_file = os.path.join(target_dir, '.extract.journal')
+    # --append keeps the journal entries of the documents aligned before
+    with Journal(journal_file, resume=opt.resume or opt.append) as journal, \
+            BackgroundWriter(opt.pipeline, opener=open_file) as writer:
+        pending = []
+        for filename in filenames:
+            if journal.done(filename, [output_file(filename)]):
+                for key, value in journal.completed[filename].items():
+                    counts[key] += value
+            elif opt.append and os.path.exists(find_file(os.path.join(target_dir, filename + '.v2.json'))):
+                continue
+            else:
+                pending.append(filename)
+        if len(pending) < len(filenames):
+            print('Resuming, {} of {} files already done.'.format(len(filenames) - len(pending), len(filenames)))
+
+        if opt.workers > 1:
+            tasks = [(target_dir, opt.lang, filename, cache_backend) for filename in pending]
+            documents = run_scheduled(process_document, tasks, [document_cost(target_dir, f) for f in pending],
+                                      opt.workers, init_worker, (opt.lang, opt.tokenizer))
+        else:
+            documents = run_pipeline(pending, [read, align], depth=opt.pipeline)
+        for filename, jsonObj, entities, events, relations, cache in tqdm(documents, total=len(pending)):
+            modified_entities, ent_dropped, ent_skipped, ent_wrong_head = entities
+            modified_events, eve_dropped, eve_wrong_trigger = events
+            modified_relations, rel_dropped = relations
+
+            writer.write(output_file(filename), jsonio.dumps(OrderedDict([
                 ('entities', modified_entities),
                 ('events', modified_events),
                 ('relations', modified_relations)
-            ]), fw)
+            ])))
+            if cache is not None:
+                writer.write(cache_file(filename), cache.dumps())
+                hits += cache.hits
+                misses += cache.misses
+
+            stats = {
+                'ent': len(jsonObj['entities']), 'ent_dropped': ent_dropped,
+                'ent_skipped': ent_skipped, 'ent_wrong_head': ent_wrong_head,
+                'eve': len(jsonObj['events']), 'eve_dropped': eve_dropped,
+                'eve_wrong_trigger': eve_wrong_trigger,
+                'rel': len(jsonObj['relations']), 'rel_dropped': rel_dropped
+            }
+            for key, value in stats.items():
+                counts[key] += value
+            writer.submit(journal.mark, filename, stats)
 
     print('[Entities] Total {:>5}, Skipped {:>4}, Dropped {:>4}, Wrong-Head {:>2}.'.format(
-        ent, ent_skipped, ent_dropped, ent_wrong_head))
+        counts['ent'], counts['ent_skipped'], counts['ent_dropped'], counts['ent_wrong_head']))
     print('[Events] Total {:>5}, Dropped {:>4}, Wrong-Trigger {:>2}.'.format(
-        eve, eve_dropped, eve_wrong_trigger))
-    print('[Relations] Total {:>5}, Dropped {:>4}.'.format(rel, rel_dropped))
+        counts['eve'], counts['eve_dropped'], counts['eve_wrong_trigger']))
+    print('[Relations] Total {:>5}, Dropped {:>4}.'.format(counts['rel'], counts['rel_dropped']))
+    if cache_backend is not None:
+        print('[Alignment cache] Hits {:>5}, Misses {:>5}, Hit rate {:>5.1%}.'.format(
+            hits, misses, hits / (hits + misses) if hits + misses > 0 else 0.))
 
 
 def main(args):
     args.data = os.path.join(args.data, lang_name[args.lang])
-    print('--' * 10 + ' Train ' + '--' * 10)
-    modify_files(args, 'train')
-    print('--' * 10 + ' Dev ' + '--' * 10)
-    modify_files(args, 'dev')
-    print('--' * 10 + ' Test ' + '--' * 10)
-    modify_files(args, 'test')
+    args.profiler = Profiler(args.profile, args.profile_docs, prefix='extract')
+    with args.profiler.stage('align'):
+        modify_files(args)
+    args.profiler.close()
 
 
 if __name__ == '__main__':
@@ -597,6 +789,24 @@ if __name__ == '__main__':
                         help="Path of ACE2005 data")
     parser.add_argument('--lang', type=str, help="Name of the language", default='en',
                         choices=['en', 'ar', 'zh'])
+    parser.add_argument('--tokenizer', type=str, default='udpipe', choices=backends,
+                        help="Tokenizer backend of the alignment fallbacks, use the one of format.py")
+    parser.add_argument('--pipeline', type=int, default=0,
+                        help="Queue depth between the read/align/write stages, 0 runs them sequentially")
+    parser.add_argument('--compress', type=str, default='none', choices=['none', 'gz', 'xz', 'zst'],
+                        help="Compression of the .v2.json files")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip the documents an interrupted run has already completed")
+    parser.add_argument('--append', action='store_true',
+                        help="Only align the documents that have no .v2.json yet")
+    parser.add_argument('--no-align-cache', action='store_true',
+                        help="Align every mention again instead of reusing the results stored in <document>.align.json")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes, documents are dispatched largest first")
+    parser.add_argument('--profile', type=str, default=None,
+                        help="Directory for cProfile (.prof) and tracemalloc reports of every stage")
+    parser.add_argument('--profile-docs', type=int, default=0,
+                        help="With --profile, also keep the profiles of the N slowest documents")
     args = parser.parse_args()
     print('\n' + '*' * 20 + lang_name[args.lang] + '*' * 20 + '\n')
     main(args)
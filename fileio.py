@@ -0,0 +1,84 @@
+import os
+import gzip
+import lzma
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+tmp_prefix = '.tmp-'
+
+compression_suffix = {
+    'none': '',
+    'gz': '.gz',
+    'xz': '.xz',
+    'zst': '.zst'
+}
+
+
+def compressed_name(path, compress='none'):
+    """Append the suffix of the `compress` method (none|gz|xz|zst) to `path`."""
+    if compress == 'zst' and zstandard is None:
+        raise ImportError("zstd compression requires the 'zstandard' package")
+    return path + compression_suffix[compress]
+
+
+def strip_compression(path):
+    """Remove a compression suffix from `path`, e.g. `a.conllu.gz` -> `a.conllu`."""
+    for suffix in compression_suffix.values():
+        if suffix and path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def variants(path):
+    """`path` without compression suffix and with every compression suffix."""
+    path = strip_compression(path)
+    return [path + suffix for suffix in compression_suffix.values()]
+
+
+def find_file(path):
+    """Return the most recently written of `path` and its compressed variants, `path` if none exists."""
+    existing = [variant for variant in variants(path) if os.path.exists(variant)]
+    if not existing:
+        return path
+    return max(existing, key=os.path.getmtime)
+
+
+def remove_variants(path):
+    """Delete the variants of `path` in other compressions, so readers never pick up a stale one."""
+    for variant in variants(path):
+        if variant != path and os.path.exists(variant):
+            os.remove(variant)
+
+
+def open_file(path, mode='r', encoding='utf-8'):
+    """Open a text file, transparently (de)compressing it according to its extension."""
+    if 'b' in mode:
+        encoding = None
+    elif 't' not in mode:
+        mode += 't'
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, encoding=encoding)
+    if path.endswith('.xz') or path.endswith('.lzma'):
+        return lzma.open(path, mode, encoding=encoding)
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError("reading '%s' requires the 'zstandard' package" % path)
+        return zstandard.open(path, mode, encoding=encoding)
+    return open(path, mode.replace('t', ''), encoding=encoding)
+
+
+def atomic_write(path, content, opener=open_file):
+    """Write `content` to a temporary file next to `path` and rename it into place.
+
+    A crash while writing leaves only the temporary file behind, never a truncated `path`.
+    The temporary name keeps the extension so `opener` still picks the compression.
+    """
+    dirname, basename = os.path.split(path)
+    tmp_path = os.path.join(dirname, tmp_prefix + basename)
+    with opener(tmp_path, 'w', encoding='utf-8') as fw:
+        fw.write(content)
+    os.replace(tmp_path, path)
+    remove_variants(path)
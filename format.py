@@ -1,13 +1,20 @@
+import io
 import os
-import json
+import jsonio
 import argparse
 from bs4 import BeautifulSoup
 from pathlib import Path
 from tqdm import tqdm
 from collections import OrderedDict
-from udpipe import Model
+from tokenization import backends, load_tokenizer, count_words
 from ace_parser import Parser
+from archive import open_source
 from prettytable import PrettyTable
+from pipeline import run_pipeline, BackgroundWriter
+from scheduler import run_scheduled, run_ordered
+from profiling import Profiler
+from fileio import open_file, find_file, compressed_name
+from checkpoint import Journal, remove_partial_files
 
 model_map = {
     'en': 'udpipe/english-ewt-ud-2.5-191206.udpipe',
@@ -47,9 +54,9 @@ def get_filenames(args):
         with open(filepath) as f:
             for line in f:
                 filename = '.'.join(line.strip().split('.')[:-2])
-                sgm_file = os.path.join(args.data, '{}.sgm'.format(filename))
-                xml_file = os.path.join(args.data, '{}.apf.xml'.format(filename))
-                if os.path.exists(sgm_file) and os.path.exists(xml_file):
+                sgm_file = '{}.sgm'.format(filename)
+                xml_file = '{}.apf.xml'.format(filename)
+                if args.source.exists(sgm_file) and args.source.exists(xml_file):
                     filelist.append(filename)
                 else:
                     not_found.append(filename)
@@ -66,24 +73,66 @@ def get_filenames(args):
     return train, dev, test
 
 
-def parse_sgm(model, sgm_path):
-    sgm_file = os.path.join(args.data, '{}.sgm'.format(sgm_path))
-    with open(sgm_file, 'r') as f:
+def text_regions(soup, regions):
+    """Character spans of soup.text inside the SGML elements named in `regions`, e.g. BODY."""
+    regions = set(region.lower() for region in regions)
+    spans = []
+    offset = 0
+    for string in soup.strings:
+        if any(parent.name in regions for parent in string.parents):
+            if spans and spans[-1][1] == offset:
+                spans[-1][1] += len(string)
+            else:
+                spans.append([offset, offset + len(string)])
+        offset += len(string)
+    return spans
+
+
+def mask_text(text, spans):
+    """Replace the text outside `spans` by newlines.
+
+    Offsets stay those of the full text, so they still match the APF positions, and the
+    tokenizer skips the blank lines at almost no cost.
+    """
+    pieces = []
+    last = 0
+    for start, end in spans:
+        pieces.append('\n' * (start - last))
+        pieces.append(text[start:end])
+        last = end
+    pieces.append('\n' * (len(text) - last))
+    return ''.join(pieces)
+
+
+def sgm_text(data):
+    with io.TextIOWrapper(io.BytesIO(data), encoding='utf-8') as f:
         soup = BeautifulSoup(f.read(), features='html.parser')
-        sgm_text = soup.text
+        if args.regions:
+            return mask_text(soup.text, text_regions(soup, args.regions))
+        return soup.text
 
-        sentences = model.tokenize(sgm_text, 'ranges')
-        total_words = 0
-        for s in sentences:
-            total_words += len(s.words)
-            model.tag(s)
-            model.parse(s)
-        conllu = model.write(sentences, "conllu")
-        return conllu, len(sentences), total_words
 
+def read_sgm(sgm_path):
+    return sgm_text(args.source.read(['{}.sgm'.format(sgm_path)])[0])
 
-def parse_xml(xml_path):
-    parser = Parser(os.path.join(args.data, xml_path))
+
+def annotate_text(model, sgm_text):
+    sentences = model.tokenize(sgm_text, 'ranges')
+    total_words = 0
+    for s in sentences:
+        total_words += count_words(s)
+        model.tag(s)
+        model.parse(s)
+    conllu = model.write(sentences, "conllu")
+    return conllu, len(sentences), total_words
+
+
+def parse_sgm(model, sgm_path):
+    return annotate_text(model, read_sgm(sgm_path))
+
+
+def apf_mentions(xml_path, data):
+    parser = Parser(xml_path, io.BytesIO(data))
     return OrderedDict([
         ('entities', parser.entity_mentions),
         ('events', parser.event_mentions),
@@ -91,54 +140,161 @@ def parse_xml(xml_path):
     ])
 
 
-def process_data(opt, model, filenames, split):
-    outdir = os.path.join(opt.output, split)
-    Path(outdir).mkdir(parents=True, exist_ok=True)
-    total_entities = 0
-    total_events = 0
-    total_relations = 0
-    total_event_arguments = 0
-    total_sentences = 0
-    total_words = 0
-    for filename in tqdm(filenames, total=len(filenames)):
+def parse_xml(xml_path):
+    return apf_mentions(xml_path, args.source.read(['{}.apf.xml'.format(xml_path)])[0])
+
+
+def parse_document(filename, sgm_data, apf_data):
+    return filename, sgm_text(sgm_data), apf_mentions(filename, apf_data)
+
+
+def read_document(filename):
+    """Text and mentions of a document; its .sgm and .apf.xml are read together, in archive order."""
+    return parse_document(filename, *args.source.read(['{}.sgm'.format(filename), '{}.apf.xml'.format(filename)]))
+
+
+# model of a worker process of `--workers`
+worker_model = None
+
+
+def init_worker(opt, open_data=True):
+    global args, worker_model
+    # workers are started by a fork server, nothing is inherited from the parent
+    if open_data:
+        opt.source = open_source(opt.data, lang_name[opt.lang])
+    args = opt
+    if worker_model is None:
+        worker_model = load_tokenizer(opt.tokenizer, opt.lang, model_map[opt.lang])
+
+
+def process_document(filename):
+    filename, text, jsonobj = read_document(filename)
+    return (filename, jsonobj) + annotate_text(worker_model, text)
+
+
+def process_contents(item):
+    """`process_document` on the file contents read by the parent, for sequential sources."""
+    filename, text, jsonobj = parse_document(*item)
+    return (filename, jsonobj) + annotate_text(worker_model, text)
+
+
+def read_contents(filenames):
+    for filename in filenames:
+        yield (filename,) + tuple(args.source.read(['{}.sgm'.format(filename), '{}.apf.xml'.format(filename)]))
+
+
+def document_cost(filename):
+    """Estimated processing cost from the file sizes only: UDPipe time grows with the text,
+    APF parsing with the mentions, i.e. with the size of the .apf.xml."""
+    return args.source.size('{}.sgm'.format(filename)) + args.source.size('{}.apf.xml'.format(filename)) // 4
+
+
+def process_data(opt, model, filenames):
+    """Annotate the documents into `opt.output`, keyed by document id only; return the stats of every document."""
+    outdir = opt.output
+    remove_partial_files(outdir)
+    doc_stats = dict()
+
+    def output_files(filename):
         outfile = os.path.split(filename)[-1]
         conllu_file = os.path.join(outdir, '{}.conllu'.format(outfile))
-        with open(conllu_file, 'w') as fw:
-            conllu, num_sent, num_words = parse_sgm(model, filename)
-            total_sentences += num_sent
-            total_words += num_words
-            fw.write(conllu)
-
         json_file = os.path.join(outdir, '{}.v1.json'.format(outfile))
-        with open(json_file, 'w') as fw:
-            jsonobj = parse_xml(filename)
-            total_entities += len(jsonobj['entities'])
-            total_events += len(jsonobj['events'])
-            total_relations += len(jsonobj['relations'])
-            total_event_arguments += sum([len(em['arguments']) for em in jsonobj['events']])
-            json.dump(jsonobj, fw)
-
-    return {
-        'total_files': len(filenames),
-        'total_sentences': total_sentences,
-        'total_words': total_words,
-        'total_entities': total_entities,
-        'total_events': total_events,
-        'total_relations': total_relations,
-        'total_event_arguments': total_event_arguments
-    }
+        return compressed_name(conllu_file, opt.compress), compressed_name(json_file, opt.compress)
+
+    def annotate(item):
+        filename, sgm_text, jsonobj = item
+        return (filename, jsonobj) + annotate_text(model, sgm_text)
+    annotate = opt.profiler.wrap_document(annotate, key=lambda item: item[0])
+
+    journal_file = os.path.join(outdir, '.format.journal')
+    with Journal(journal_file, resume=opt.resume) as journal, \
+            BackgroundWriter(opt.pipeline, opener=open_file) as writer:
+        pending = []
+        for filename in filenames:
+            if journal.done(filename, output_files(filename)):
+                doc_stats[filename] = journal.completed[filename]
+            else:
+                pending.append(filename)
+        if len(pending) < len(filenames):
+            print('Resuming, {} of {} files already done.'.format(len(filenames) - len(pending), len(filenames)))
+        # a tar archive is only read forward, in the order of its members
+        pending = opt.source.document_order(pending)
+
+        if opt.workers > 1:
+            worker_opt = argparse.Namespace(**{k: v for k, v in vars(opt).items()
+                                             if k not in ['source', 'profiler']})
+            if opt.source.sequential:
+                # the parent reads the archive once, the workers parse and annotate
+                documents = run_ordered(process_contents, read_contents(pending), opt.workers,
+                                        initializer=init_worker, initargs=(worker_opt, False))
+            else:
+                documents = run_scheduled(process_document, pending, [document_cost(f) for f in pending],
+                                          opt.workers, init_worker, (worker_opt,))
+        else:
+            documents = run_pipeline(pending, [read_document, annotate], depth=opt.pipeline)
+        for filename, jsonobj, conllu, num_sent, num_words in tqdm(documents, total=len(pending)):
+            conllu_file, json_file = output_files(filename)
+            writer.write(conllu_file, conllu)
+            writer.write(json_file, jsonio.dumps(jsonobj))
+
+            stats = {
+                'total_sentences': num_sent,
+                'total_words': num_words,
+                'total_entities': len(jsonobj['entities']),
+                'total_events': len(jsonobj['events']),
+                'total_relations': len(jsonobj['relations']),
+                'total_event_arguments': sum([len(em['arguments']) for em in jsonobj['events']])
+            }
+            doc_stats[filename] = stats
+            writer.submit(journal.mark, filename, stats)
+
+    return doc_stats
+
+
+def split_totals(doc_stats, filenames):
+    totals = OrderedDict([
+        ('total_files', len(filenames)),
+        ('total_sentences', 0),
+        ('total_words', 0),
+        ('total_entities', 0),
+        ('total_events', 0),
+        ('total_relations', 0),
+        ('total_event_arguments', 0)
+    ])
+    for filename in filenames:
+        for key, value in doc_stats[filename].items():
+            totals[key] += value
+    return totals
 
 
 def main(args):
-    args.data = os.path.join(args.data, lang_name[args.lang])
+    args.source = open_source(args.data, lang_name[args.lang])
     args.output = os.path.join(args.output, lang_name[args.lang])
     Path(args.output).mkdir(parents=True, exist_ok=True)
     train_files, dev_files, test_files = get_filenames(args)
 
-    model = Model(model_map[args.lang])
-    train_stat = process_data(args, model, train_files, 'train')
-    dev_stat = process_data(args, model, dev_files, 'dev')
-    test_stat = process_data(args, model, test_files, 'test')
+    # a document listed in several splits is annotated once
+    all_files = list(OrderedDict.fromkeys(train_files + dev_files + test_files))
+    if args.append:
+        cached = [os.path.basename(f) for f in all_files
+                  if os.path.exists(find_file(os.path.join(args.output, os.path.basename(f) + '.v1.json')))]
+        if cached:
+            raise SystemExit('%d documents are already in %s: %s' % (len(cached), args.output, ' '.join(cached)))
+        # keep the journal entries of the documents annotated before
+        args.resume = True
+
+    args.profiler = Profiler(args.profile, args.profile_docs, prefix='format')
+    # with --workers, only the workers annotate, each loads its own model in init_worker
+    model = None
+    if args.workers <= 1:
+        with args.profiler.stage('load_model'):
+            model = load_tokenizer(args.tokenizer, args.lang, model_map[args.lang])
+    with args.profiler.stage('annotate'):
+        doc_stats = process_data(args, model, all_files)
+    args.profiler.close()
+    train_stat = split_totals(doc_stats, train_files)
+    dev_stat = split_totals(doc_stats, dev_files)
+    test_stat = split_totals(doc_stats, test_files)
 
     table = PrettyTable()
     table.field_names = ["Attribute", "Train", "Dev", "Test", "Total"]
@@ -190,13 +346,31 @@ def main(args):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--data', type=str, default='./ace_2005/data/',
-                        help="Path of ACE2005 data")
+                        help="Path of ACE2005 data, or of the LDC .tgz/.zip archive")
     parser.add_argument('--filelist', type=str, default='./filelist/',
                         help="List of files for train/dev/test split")
     parser.add_argument('--lang', type=str, help="Name of the language", default='en',
                         choices=['en', 'ar', 'zh'])
     parser.add_argument('--output', type=str, default='./processed-data/',
                         help="Path of the output directory")
+    parser.add_argument('--tokenizer', type=str, default='udpipe', choices=backends,
+                        help="Tokenizer backend: udpipe, or the rule-based regex (en/ar) and char (zh) without tags")
+    parser.add_argument('--regions', type=str, nargs='*', default=[],
+                        help="Only annotate the text of these SGML elements, e.g. BODY, instead of the whole document")
+    parser.add_argument('--pipeline', type=int, default=0,
+                        help="Queue depth between the read/annotate/write stages, 0 runs them sequentially")
+    parser.add_argument('--compress', type=str, default='none', choices=['none', 'gz', 'xz', 'zst'],
+                        help="Compression of the cached .conllu and .v1.json files")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip the documents an interrupted run has already completed")
+    parser.add_argument('--append', action='store_true',
+                        help="Only annotate new documents, fail if a document of the file lists is already cached")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes, documents are dispatched largest first")
+    parser.add_argument('--profile', type=str, default=None,
+                        help="Directory for cProfile (.prof) and tracemalloc reports of every stage")
+    parser.add_argument('--profile-docs', type=int, default=0,
+                        help="With --profile, also keep the profiles of the N slowest documents")
     args = parser.parse_args()
     print('\n' + '*' * 20 + lang_name[args.lang] + '*' * 20 + '\n')
     main(args)
@@ -0,0 +1,67 @@
+"""json encoding/decoding through the fastest installed backend.
+
+orjson is preferred, then ujson, then the standard library; the ACE_JSON_BACKEND
+environment variable (orjson|ujson|json) or `set_backend` picks one explicitly. The
+backends produce semantically equivalent json, but not the same text: orjson indents
+pretty output by 2 spaces and none of them escapes non-ASCII characters except the
+standard library in compact mode.
+"""
+import os
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+backends = [name for name, module in [('orjson', orjson), ('ujson', ujson), ('json', json)] if module is not None]
+backend = None
+# layout of the backend's output, for writers producing a json list one item at a time
+indent = 4
+separator = ', '
+
+
+def set_backend(name=None):
+    """Use the backend `name`, or the fastest installed one if `name` is None."""
+    global backend, indent, separator
+    if name is None:
+        name = backends[0]
+    if name not in backends:
+        raise ImportError("json backend '%s' is not installed" % name)
+    backend = name
+    indent = 2 if name == 'orjson' else 4
+    separator = ', ' if name == 'json' else ','
+
+
+def dumps(obj, pretty=False):
+    """Encode `obj` as a json string, indented if `pretty`."""
+    if backend == 'orjson':
+        option = orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(obj, option=option).decode('utf-8')
+    if backend == 'ujson':
+        if pretty:
+            return ujson.dumps(obj, indent=indent, ensure_ascii=False, escape_forward_slashes=False)
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+    if pretty:
+        return json.dumps(obj, indent=indent, ensure_ascii=False)
+    return json.dumps(obj)
+
+
+def loads(text):
+    if backend == 'orjson':
+        return orjson.loads(text)
+    if backend == 'ujson':
+        return ujson.loads(text)
+    return json.loads(text)
+
+
+def load(f):
+    return loads(f.read())
+
+
+set_backend(os.environ.get('ACE_JSON_BACKEND'))
@@ -0,0 +1,163 @@
+import queue
+import threading
+from fileio import atomic_write
+
+_END = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _feed(source, out_q, stop):
+    try:
+        for item in source:
+            if not _put(out_q, item, stop):
+                return
+    except BaseException as e:
+        _put(out_q, _Failure(e), stop)
+        return
+    _put(out_q, _END, stop)
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+
+def _work(stage, in_q, out_q, stop):
+    while True:
+        item = _get(in_q, stop)
+        if item is _END or isinstance(item, _Failure):
+            _put(out_q, item, stop)
+            return
+        try:
+            result = stage(item)
+        except BaseException as e:
+            _put(out_q, _Failure(e), stop)
+            return
+        if not _put(out_q, result, stop):
+            return
+
+
+def run_pipeline(source, stages, depth=4):
+    """Yield `source` items passed through `stages` (functions called in order).
+
+    With `depth > 0` the iteration of `source` and every stage run in their own
+    thread, connected by queues holding at most `depth` items, so reading, annotating
+    and writing of different documents overlap while at most about
+    `depth * (len(stages) + 1)` documents are in memory. Items come out in input order.
+    With `depth <= 0` everything runs sequentially in the calling thread.
+    An exception raised in any stage is re-raised in the caller.
+    """
+    if depth <= 0:
+        for item in source:
+            for stage in stages:
+                item = stage(item)
+            yield item
+        return
+
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=depth) for _ in range(len(stages) + 1)]
+    threads = [threading.Thread(target=_feed, args=(source, queues[0], stop), daemon=True)]
+    for i, stage in enumerate(stages):
+        threads.append(threading.Thread(target=_work, args=(stage, queues[i], queues[i + 1], stop),
+                                        daemon=True))
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            item = queues[-1].get()
+            if item is _END:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        for q in queues:
+            # unblock threads waiting on a full queue
+            while not q.empty():
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    break
+        for t in threads:
+            t.join(timeout=1)
+
+
+class BackgroundWriter:
+    """Write files from a background thread, holding at most `maxsize` pending writes.
+
+    `write(path, content)` returns immediately unless the queue is full; files are
+    written atomically and in order. `submit(fn, *args)` runs `fn` in the same order,
+    e.g. to record a document once all its files are written. A failure is re-raised
+    by the next `write`/`submit` or by `close`. With `maxsize <= 0` everything runs
+    synchronously.
+    """
+
+    def __init__(self, maxsize=8, opener=open):
+        self.opener = opener
+        self.error = None
+        self.thread = None
+        if maxsize > 0:
+            self.queue = queue.Queue(maxsize=maxsize)
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _write(self, path, content):
+        atomic_write(path, content, self.opener)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _END:
+                return
+            if self.error is None:
+                try:
+                    item[0](*item[1:])
+                except BaseException as e:
+                    self.error = e
+
+    def _check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, fn, *args):
+        if self.thread is None:
+            fn(*args)
+            return
+        self._check()
+        self.queue.put((fn,) + args)
+
+    def write(self, path, content):
+        self.submit(self._write, path, content)
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(_END)
+            self.thread.join()
+            self.thread = None
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,144 @@
+import os
+import time
+import heapq
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Profiler:
+    """cProfile and tracemalloc hooks around the stages and documents of a script.
+
+    Every `stage(name)` writes `<prefix>.<name>.prof` (pstats format, readable by
+    pstats, snakeviz or flamegraph converters) and `<prefix>.<name>.mem.txt` (traced
+    peak memory and top allocation sites) to `outdir`. With `top_docs > 0`, functions
+    wrapped by `wrap_document` are profiled per document and the `top_docs` slowest
+    documents are dumped as `<prefix>.doc<rank>.<document>.prof`, with a summary in
+    `<prefix>.docs.txt`.
+
+    Without `outdir` the profiler is off: `stage` returns a shared no-op context and
+    `wrap_document` returns the function unchanged. cProfile only sees the thread it
+    is enabled in, so use `--pipeline 0 --workers 1` for complete stage profiles.
+    Since Python 3.12 only one cProfile profiler can be active in the process, so a
+    document handled by another thread while the stage profiler runs is only timed.
+    """
+
+    def __init__(self, outdir=None, top_docs=0, prefix='run', top_allocations=25):
+        self.enabled = outdir is not None
+        self.outdir = outdir
+        self.top_docs = top_docs
+        self.prefix = prefix
+        self.top_allocations = top_allocations
+        self.slowest = []
+        self.recorded = 0
+        self.lock = threading.Lock()
+        self.current = None  # (thread id, cProfile.Profile, pstats.Stats of the documents)
+        if self.enabled:
+            os.makedirs(outdir, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.outdir, '{}.{}'.format(self.prefix, name))
+
+    @contextmanager
+    def _stage(self, name):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        prof = cProfile.Profile()
+        self.current = (threading.get_ident(), prof, pstats.Stats())
+        start = time.time()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            elapsed = time.time() - start
+            doc_stats = self.current[2]
+            self.current = None
+            stats = pstats.Stats(prof)
+            stats.add(doc_stats)
+            stats.dump_stats(self.path(name + '.prof'))
+            self._dump_memory(name, elapsed)
+
+    def _dump_memory(self, name, elapsed):
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        with open(self.path(name + '.mem.txt'), 'w') as f:
+            f.write('wall time: {:.2f}s\n'.format(elapsed))
+            f.write('traced memory: current {:.1f} MiB, peak {:.1f} MiB\n'.format(current / 2 ** 20, peak / 2 ** 20))
+            f.write('top {} allocation sites:\n'.format(self.top_allocations))
+            for stat in snapshot.statistics('lineno')[:self.top_allocations]:
+                f.write('{}\n'.format(stat))
+
+    def stage(self, name):
+        if not self.enabled:
+            return _no_op
+        return self._stage(name)
+
+    def wrap_document(self, fn, key=str):
+        """Profile every call of `fn` as one document, named `key(item)`."""
+        if not self.enabled or self.top_docs <= 0:
+            return fn
+
+        def wrapper(item):
+            current = self.current
+            stage_prof = None
+            if current is not None and current[0] == threading.get_ident():
+                # one profiler per thread, the stage profile gets the document's stats later
+                stage_prof = current[1]
+                stage_prof.disable()
+            prof = cProfile.Profile()
+            start = time.time()
+            try:
+                prof.enable()
+            except ValueError:
+                # another profiler is active (Python 3.12+, sys.monitoring), only time the document
+                prof = None
+            try:
+                return fn(item)
+            finally:
+                if prof is not None:
+                    prof.disable()
+                elapsed = time.time() - start
+                if stage_prof is not None:
+                    if prof is not None:
+                        current[2].add(prof)
+                    stage_prof.enable()
+                self._record(elapsed, key(item), prof)
+
+        return wrapper
+
+    def _record(self, elapsed, name, prof):
+        with self.lock:
+            self.recorded += 1
+            entry = (elapsed, self.recorded, name, prof)
+            if len(self.slowest) < self.top_docs:
+                heapq.heappush(self.slowest, entry)
+            elif elapsed > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def close(self):
+        if not self.enabled or self.top_docs <= 0:
+            return
+        slowest = sorted(self.slowest, key=lambda entry: entry[0], reverse=True)
+        with open(self.path('docs.txt'), 'w') as f:
+            for rank, (elapsed, _, name, prof) in enumerate(slowest):
+                if prof is None:
+                    f.write('{:>8.2f}s  {}  (not profiled, another profiler was active)\n'.format(elapsed, name))
+                    continue
+                filename = 'doc{}.{}.prof'.format(rank, os.path.basename(name))
+                prof.dump_stats(self.path(filename))
+                f.write('{:>8.2f}s  {}  {}\n'.format(elapsed, name, self.path(filename)))
+
+
+class _NoOp:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_no_op = _NoOp()
@@ -0,0 +1,271 @@
+"""Make-like runner of format.py, extract.py and transform.py that only rebuilds stale artifacts.
+
+    python rebuild.py --lang en [--dry-run]
+
+For every document the manifest `cache_data/<Language>/.build.json` records the hashes
+of the inputs its `.conllu`/`.v1.json` (format) and `.v2.json` (extract) files were built
+from, with the hash of the code of the stage, of the UDPipe model and the options. The
+split files and BIO files (transform) depend on the file lists and on all the cached
+documents of the splits. An artifact is rebuilt when it is missing or one of those
+changed: its outputs are deleted and the stage script runs with `--resume`, which
+reprocesses exactly the documents without outputs.
+"""
+import os
+import sys
+import hashlib
+import argparse
+import subprocess
+from collections import OrderedDict
+import jsonio
+from archive import open_source
+from fileio import find_file, atomic_write
+
+model_map = {
+    'en': 'udpipe/english-ewt-ud-2.5-191206.udpipe',
+    'zh': 'udpipe/chinese-gsd-ud-2.5-191206.udpipe',
+    'ar': 'udpipe/arabic-padt-ud-2.5-191206.udpipe'
+}
+
+lang_name = {
+    'en': 'English',
+    'ar': 'Arabic',
+    'zh': 'Chinese'
+}
+
+# source files whose changes invalidate the artifacts of a stage
+stage_code = {
+    'format': ['format.py', 'ace_parser.py', 'archive.py', 'tokenization.py', 'udpipe.py'],
+    'extract': ['extract.py', 'align_cache.py', 'sentence.py', 'conllu_reader.py', 'tokenization.py', 'udpipe.py'],
+    'transform': ['transform.py', 'build_BIO.py', 'conllu_reader.py', 'jsonio.py']
+}
+cache_dir = 'cache_data'
+splits = ['train', 'dev', 'test']
+bio_files = ['token', 'entity_BIO', 'event_trigger_BIO', 'event_argument_BIO']
+
+
+def hash_file(f):
+    h = hashlib.sha1()
+    for chunk in iter(lambda: f.read(1 << 20), b''):
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_data(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def hash_path(path):
+    with open(path, 'rb') as f:
+        return hash_file(f)
+
+
+def hash_cached(path):
+    """Hash of a cached file in any compression, '-' if it does not exist (yet)."""
+    path = find_file(path)
+    return hash_path(path) if os.path.exists(path) else '-'
+
+
+def hash_strings(strings):
+    h = hashlib.sha1()
+    for s in strings:
+        h.update(s.encode('utf-8') + b'\n')
+    return h.hexdigest()
+
+
+def code_version(stage):
+    base = os.path.dirname(os.path.abspath(__file__))
+    return hash_strings(hash_path(os.path.join(base, file)) for file in stage_code[stage])
+
+
+def read_filelist(opt, split):
+    """Document paths of a split, relative to ace_2005/data/<Language>/ like in format.py."""
+    with open(os.path.join(opt.filelist, 'ace.%s.%s.txt' % (opt.lang, split))) as f:
+        return ['.'.join(line.strip().split('.')[:-2]) for line in f if line.strip()]
+
+
+class Manifest:
+    """Signatures of the artifacts of the last build, {artifact: {dependency: hash}}."""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = dict()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.records = jsonio.loads(f.read())
+
+    def stale_reason(self, artifact, signature, outputs):
+        """Why `artifact` has to be rebuilt, or None if it is up to date."""
+        record = self.records.get(artifact)
+        if record is None:
+            return 'new'
+        missing = [path for path in outputs if not os.path.exists(find_file(path))]
+        if missing:
+            return 'missing ' + os.path.basename(missing[0])
+        changed = [key for key in signature if record.get(key) != signature[key]]
+        if changed:
+            return ', '.join(changed) + ' changed'
+        return None
+
+    def save(self):
+        atomic_write(self.path, jsonio.dumps(self.records, pretty=True), opener=open)
+
+
+def remove_outputs(outputs):
+    for path in outputs:
+        path = find_file(path)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def report(stage, reasons, total):
+    print('[{}] {} of {} stale'.format(stage, len(reasons), total))
+    for artifact, reason in reasons.items():
+        print('    {}: {}'.format(artifact, reason))
+
+
+def run_stage(opt, script, extra_args, stdin=None):
+    command = [sys.executable, script, '--lang', opt.lang] + extra_args
+    print('Running ' + ' '.join(command))
+    subprocess.run(command, input=stdin, universal_newlines=True, check=True)
+
+
+def rebuild_documents(opt, manifest, stage, docs, signature_of, outputs_of, script, extra_args, upstream=()):
+    """Rebuild the stale artifacts of a per-document stage; return the names of the rebuilt documents.
+
+    With --dry-run nothing is rebuilt, so the `upstream` documents rebuilt by the previous
+    stage are reported as stale instead of comparing the hashes of their old inputs.
+    """
+    signatures = OrderedDict()
+    reasons = OrderedDict()
+    for doc in docs:
+        signatures[doc] = signature_of(doc)
+        reason = manifest.stale_reason(stage + ':' + doc, signatures[doc], outputs_of(doc))
+        if opt.dry_run and doc in upstream:
+            reason = 'inputs rebuilt'
+        if reason is not None:
+            reasons[doc] = reason
+    report(stage, reasons, len(docs))
+    if not reasons or opt.dry_run:
+        return list(reasons)
+    for doc in reasons:
+        remove_outputs(outputs_of(doc))
+    run_stage(opt, script, extra_args + ['--resume'])
+    for doc in reasons:
+        if all(os.path.exists(find_file(path)) for path in outputs_of(doc)):
+            manifest.records[stage + ':' + doc] = signatures[doc]
+    manifest.save()
+    return list(reasons)
+
+
+def main(opt):
+    outdir = os.path.join(cache_dir, lang_name[opt.lang])
+    os.makedirs(outdir, exist_ok=True)
+    manifest = Manifest(os.path.join(outdir, '.build.json'))
+    source = open_source(opt.data, lang_name[opt.lang])
+    file_lists = dict((split, read_filelist(opt, split)) for split in splits)
+    paths = list(OrderedDict.fromkeys(path for split in splits for path in file_lists[split]
+                                      if source.exists(path + '.sgm') and source.exists(path + '.apf.xml')))
+    doc_path = dict((os.path.basename(path), path) for path in paths)
+    docs = list(doc_path)
+
+    def cached(doc, suffix):
+        return os.path.join(outdir, doc + suffix)
+
+    model = opt.tokenizer
+    if opt.tokenizer == 'udpipe' and os.path.exists(model_map[opt.lang]):
+        model = hash_path(model_map[opt.lang])
+    options = ['--tokenizer', opt.tokenizer, '--pipeline', str(opt.pipeline), '--workers', str(opt.workers),
+               '--compress', opt.compress]
+
+    format_code = code_version('format')
+    format_options = hash_strings([opt.tokenizer] + opt.regions)
+
+    # the sources are hashed in archive order, a tar archive is only read forward
+    source_hashes = dict()
+    for path in source.document_order(paths):
+        sgm, apf = source.read([path + '.sgm', path + '.apf.xml'])
+        source_hashes[os.path.basename(path)] = hash_data(sgm), hash_data(apf)
+
+    def format_signature(doc):
+        signature = OrderedDict(zip(['sgm', 'apf.xml'], source_hashes[doc]))
+        signature.update([('code', format_code), ('model', model), ('options', format_options)])
+        return signature
+
+    formatted = rebuild_documents(opt, manifest, 'format', docs, format_signature,
+                                  lambda doc: [cached(doc, '.conllu'), cached(doc, '.v1.json')], 'format.py',
+                                  ['--data', opt.data, '--filelist', opt.filelist, '--output', cache_dir + '/'] +
+                                  options + (['--regions'] + opt.regions if opt.regions else []))
+
+    extract_code = code_version('extract')
+
+    def extract_signature(doc):
+        return OrderedDict([
+            ('conllu', hash_cached(cached(doc, '.conllu'))),
+            ('v1.json', hash_cached(cached(doc, '.v1.json'))),
+            ('code', extract_code), ('model', model), ('options', opt.tokenizer)
+        ])
+
+    extracted = rebuild_documents(opt, manifest, 'extract', docs, extract_signature,
+                                  lambda doc: [cached(doc, '.v2.json')], 'extract.py',
+                                  ['--data', cache_dir + '/'] + options, upstream=set(formatted))
+
+    # the splits depend on the file lists and on every cached document they contain
+    def transform_signature():
+        doc_hashes = []
+        for split in splits:
+            for path in file_lists[split]:
+                doc = os.path.basename(path)
+                for suffix in ['.conllu', '.v2.json']:
+                    doc_hashes.append(doc + suffix + ' ' + hash_cached(cached(doc, suffix)))
+        return OrderedDict([
+            ('filelists', hash_strings(hash_path(os.path.join(opt.filelist, 'ace.%s.%s.txt' % (opt.lang, split)))
+                                       for split in splits)),
+            ('documents', hash_strings(doc_hashes)),
+            ('code', code_version('transform')),
+            ('options', hash_strings(opt.fields + [opt.compress, opt.json_format]))
+        ])
+
+    outputs = [os.path.join('output', '{}-{}.json'.format(opt.lang, split)) for split in splits]
+    outputs += [os.path.join('output', 'BIO', split, file + '.json') for split in splits for file in bio_files]
+    signature = transform_signature()
+    reason = manifest.stale_reason('transform', signature, outputs)
+    if opt.dry_run and extracted:
+        reason = 'documents rebuilt'
+    report('transform', OrderedDict([('splits', reason)]) if reason else OrderedDict(), 1)
+    if reason and not opt.dry_run:
+        os.makedirs('output', exist_ok=True)
+        # the runner only builds the divisions of the file lists, answer 'n' to the prompt
+        run_stage(opt, 'transform.py', ['--filelist', opt.filelist, '--compress', opt.compress,
+                                        '--json-format', opt.json_format, '--workers', str(opt.workers),
+                                        '--outputs', 'json', 'bio', 'stats'] +
+                  (['--fields'] + opt.fields if opt.fields else []), stdin='n\n')
+        manifest.records['transform'] = signature
+        manifest.save()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default='./ace_2005/data/',
+                        help="Path of ACE2005 data, or of the LDC .tgz/.zip archive")
+    parser.add_argument('--filelist', type=str, default='./filelist/',
+                        help="List of files for train/dev/test split")
+    parser.add_argument('--lang', type=str, help="Name of the language", default='en',
+                        choices=['en', 'ar', 'zh'])
+    parser.add_argument('--tokenizer', type=str, default='udpipe', choices=['udpipe', 'regex', 'char'],
+                        help="Tokenizer backend of format.py and extract.py")
+    parser.add_argument('--regions', type=str, nargs='*', default=[],
+                        help="Only annotate the text of these SGML elements, see format.py")
+    parser.add_argument('--fields', type=str, nargs='*', default=[], choices=['offsets', 'ud'],
+                        help="Per-token fields of the transform.py outputs")
+    parser.add_argument('--compress', type=str, default='none', choices=['none', 'gz', 'xz', 'zst'],
+                        help="Compression of the files written by the stages")
+    parser.add_argument('--json-format', type=str, default='pretty', choices=['pretty', 'compact'],
+                        help="Layout of the split and BIO json files")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes of the stages")
+    parser.add_argument('--pipeline', type=int, default=0,
+                        help="Queue depth of format.py and extract.py")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Only report what is stale and why")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,347 @@
+"""Frozen copies of the original alignment, transform and tagging code.
+
+They are the reference of `equivalence.py`: a faster implementation in extract.py,
+transform.py or build_BIO.py must produce the same results. Do not optimize them.
+"""
+import json
+import string
+import numpy as np
+from conllu import parse
+
+
+def compare_string_without_space(src_words, tgt_words, ignore_punc=False):
+    src_chars = list(' '.join(src_words).replace(" ", ""))
+    tgt_chars = list(' '.join(tgt_words).replace(" ", ""))
+    if ignore_punc:
+        src_chars = [ch for ch in src_chars if ch not in string.punctuation]
+        tgt_chars = [ch for ch in tgt_chars if ch not in string.punctuation]
+    return src_chars == tgt_chars
+
+
+def find_span_offset(sentences, text, text_start, text_end, model, lang):
+    match_positions = [-1, -1]
+    type_of_match_found = ''
+    best_sent_id = None
+    best_sent = None
+
+    tokenized_text = model.tokenize(text, 'ranges')
+    conllu = parse(model.write(tokenized_text, "conllu"))
+    text_words = [w['form'] for sent in conllu for w in sent]
+    text_len = len(text_words)
+    tokenized_text = ' '.join(text_words)
+
+    for sent in sentences:
+        best_sent = sent
+        best_sent_id = sent['id']
+        offsets = sent['offset']
+        # TODO: we do not allow spanning across sentences, should we?
+        if offsets[0][0] <= text_start and text_end <= offsets[-1][1]:
+            start, end = [], []
+            for i, tok in enumerate(offsets):
+                if tok[0] == text_start:
+                    start.append(i)
+                if tok[1] == text_end + 1:
+                    end.append(i)
+
+            # best case
+            if len(start) == 1 and len(end) == 1:
+                if start[0] <= end[0]:
+                    ent_words = sent['word'][start[0]:end[0] + 1]
+                    # we make sure that the character sequence without space matches
+                    if compare_string_without_space(text_words, ent_words):
+                        type_of_match_found = 'exact_first'
+                        match_positions = [start[0], end[0]]
+                        break
+
+            # we give another round if either len(start) == 0 or len(end) == 0
+            # the conditions are written after exploring the data
+            for i, tok in enumerate(offsets):
+                if len(start) == 0:
+                    if tok[0] == text_start - 1 or tok[0] == text_start + 1:
+                        start.append(i)
+                if len(end) == 0:
+                    if tok[1] == text_end or tok[1] == text_end + 2 or tok[1] == text_end - 1:
+                        end.append(i)
+
+            if len(start) == 1 and len(end) == 1:
+                if start[0] <= end[0]:
+                    ent_words = sent['word'][start[0]:end[0] + 1]
+                    if compare_string_without_space(text_words, ent_words):
+                        type_of_match_found = 'exact_second'
+                        match_positions = [start[0], end[0]]
+                        break
+                    else:
+                        # let's tolerate punctuations for English
+                        if lang == 'en' and compare_string_without_space(text_words, ent_words, ignore_punc=True):
+                            type_of_match_found = 'exact_second_wo_punc'
+                            match_positions = [start[0], end[0]]
+                            break
+
+            # after this point, only perform based on text match
+
+            # first try to match the target text with its' original form
+            # now, we consider one word and sub-word matches
+            one_word_matches = []
+            sub_word_matches = []
+            one_word_match_dist = []
+            sub_word_match_dist = []
+            for i in range(len(sent['word'])):
+                word = sent['word'][i]
+                if word == text:
+                    # if the target is 1 word, then perform direct match
+                    one_word_matches.append([i, i])
+                    one_word_match_dist.append(abs(offsets[i][0] - text_start))
+                elif text in word and (len(start) != 0 or len(end) != 0):
+                    # this basically performs partial match,
+                    # e.g., 'israeli' to 'israeli-palestinian'
+                    sub_word_matches.append([i, i])
+                    sub_word_match_dist.append(abs(offsets[i][0] - text_start))
+
+            if len(one_word_matches) == 1:
+                type_of_match_found = 'one_word_match'
+                match_positions = one_word_matches[0]
+                break
+            elif len(one_word_matches) == 0 and len(sub_word_matches) == 1:
+                type_of_match_found = 'sub_word_match'
+                match_positions = sub_word_matches[0]
+                break
+            elif len(one_word_matches) > 0:
+                type_of_match_found = 'closest_one_word_match'
+                index = one_word_match_dist.index(min(one_word_match_dist))
+                match_positions = one_word_matches[index]
+                break
+            elif len(sub_word_matches) > 0:
+                type_of_match_found = 'closest_sub_word_match'
+                index = sub_word_match_dist.index(min(sub_word_match_dist))
+                match_positions = sub_word_matches[index]
+                break
+
+            # let's try to match the target text with its' tokenized form
+            tokenized_text_len = len(tokenized_text)
+            tokenized_sent_text = ' '.join(sent['word'])
+
+            if tokenized_text in tokenized_sent_text:
+                matches = []
+                match_dist = []
+                for i in range(len(sent['word']) - text_len + 1):
+                    match_found = False
+                    selected_text = ' '.join(sent['word'][i: i + text_len])
+                    if sent['word'][i: i + text_len] == text_words:
+                        type_of_match_found = 'tokenized_text_match'
+                        match_found = True
+                    elif tokenized_text in selected_text:
+                        # so, there are matches such as: `my ex` in `my ex's`
+                        # `Nashville , Tenn` in `Nashville , Tenn.`
+                        selected_text = ' '.join(sent['word'][i: i + text_len])
+                        selected_text_len = len(selected_text)
+                        for j in range(selected_text_len - tokenized_text_len + 1):
+                            if selected_text[j:j + tokenized_text_len] == tokenized_text:
+                                type_of_match_found = 'tokenized_partial_text_match'
+                                match_found = True
+                    if match_found:
+                        matches.append([i, i + text_len - 1])
+                        match_dist.append(abs(offsets[i][0] - text_start))
+
+                if len(matches) > 0:
+                    if len(matches) == 1:
+                        match_positions = matches[0]
+                    else:
+                        index = match_dist.index(min(match_dist))
+                        match_positions = matches[index]
+                break
+
+    return {
+        'best_sent': best_sent,
+        'sent_id': best_sent_id,
+        'start': match_positions[0],
+        'end': match_positions[1]
+    }
+
+
+def find_subspan_offset(sent, offset, text, text_start, text_end, model):
+    ent_start, ent_end = offset
+    start, end = [], []
+    for i in range(ent_start, ent_end + 1):
+        offset = sent['offset'][i]
+        if offset[0] == text_start:
+            start.append(i)
+        if offset[1] == text_end + 1:
+            end.append(i)
+
+    # best case
+    if len(start) == 1 and len(end) == 1:
+        if start[0] <= end[0]:
+            return [start[0], end[0]]
+
+    # we give another round if either len(start) == 0 or len(end) == 0
+    # the conditions are written after exploring the data
+    for i in range(ent_start, ent_end + 1):
+        offset = sent['offset'][i]
+        if len(start) == 0:
+            if offset[0] == text_start - 1 or offset[0] == text_start + 1:
+                start.append(i)
+        if len(end) == 0:
+            if offset[1] == text_end or offset[1] == text_end + 2 or offset[1] == text_end - 1:
+                end.append(i)
+
+    if len(start) == 1 and len(end) == 1:
+        if start[0] <= end[0]:
+            return [start[0], end[0]]
+
+    # first try to match the target text with its' original form
+    # now, we consider one word and sub-word matches
+    one_word_matches = []
+    sub_word_matches = []
+    one_word_match_dist = []
+    sub_word_match_dist = []
+    for i in range(ent_start, ent_end + 1):
+        offset = sent['offset'][i]
+        word = sent['word'][i]
+        if word == text:
+            # if the target is 1 word, then perform direct match
+            one_word_matches.append([i, i])
+            one_word_match_dist.append(abs(offset[0] - text_start))
+        elif text in word and (len(start) != 0 or len(end) != 0):
+            # this basically performs partial match,
+            # e.g., 'israeli' to 'israeli-palestinian'
+            sub_word_matches.append([i, i])
+            sub_word_match_dist.append(abs(offset[0] - text_start))
+
+    if len(one_word_matches) == 1:
+        return one_word_matches[0]
+    elif len(one_word_matches) == 0 and len(sub_word_matches) == 1:
+        return sub_word_matches[0]
+    elif len(one_word_matches) > 0:
+        index = one_word_match_dist.index(min(one_word_match_dist))
+        return one_word_matches[index]
+    elif len(sub_word_matches) > 0:
+        index = sub_word_match_dist.index(min(sub_word_match_dist))
+        return sub_word_matches[index]
+
+    # let's try to match the target text with its' tokenized form
+    tokenized_text = model.tokenize(text, 'ranges')
+    conllu = parse(model.write(tokenized_text, "conllu"))
+    text_words = [w['form'] for sent in conllu for w in sent]
+    text_len = len(text_words)
+    tokenized_text = ' '.join(text_words)
+    tokenized_text_len = len(tokenized_text)
+
+    entity_words = sent['word'][ent_start: ent_end + 1]
+    tokenized_sent_text = ' '.join(entity_words)
+
+    if tokenized_text in tokenized_sent_text:
+        matches = []
+        match_dist = []
+        for i in range(len(entity_words) - text_len + 1):
+            offset = sent['offset'][i]
+            match_found = False
+            selected_text = ' '.join(entity_words[i: i + text_len])
+            if entity_words[i: i + text_len] == text_words:
+                match_found = True
+            elif tokenized_text in selected_text:
+                # so, there are matches such as: `my ex` in `my ex's`
+                # `Nashville , Tenn` in `Nashville , Tenn.`
+                selected_text = ' '.join(entity_words[i: i + text_len])
+                selected_text_len = len(selected_text)
+                for j in range(selected_text_len - tokenized_text_len + 1):
+                    if selected_text[j:j + tokenized_text_len] == tokenized_text:
+                        match_found = True
+            if match_found:
+                matches.append([i + ent_start, i + ent_start + text_len - 1])
+                match_dist.append(abs(offset[0] - text_start))
+
+        if len(matches) > 0:
+            if len(matches) == 1:
+                return matches[0]
+            else:
+                index = match_dist.index(min(match_dist))
+                return matches[index]
+
+    return [-1, -1]
+
+
+def load_processed_data(file_list, language='English'):
+    data = []
+    # 读取句子和tokens
+    for file in file_list:
+        doc_data = []
+        conll_path = r'cache_data/' + language + '/' + file + '.conllu'
+        with open(conll_path) as f:
+            conll_list = f.read().split('\n\n')
+            for conll in conll_list:
+                include_flag = 0  # 是否记录标记
+                for i in range(len(conll.split('\n'))):
+                    if 'sent_id = ' in conll.split('\n')[i]:
+                        temp = dict()
+                        temp['sent_id'] = conll.split('\n')[i].split()[-1]
+                        temp['sentence'] = conll.split('\n')[i + 1][9:]
+                        if len(temp['sentence'].split()) >= 5:  # TODO仅保留单词数大于5的句子
+                            include_flag = 1  # 是否记录标记
+                        elif language == 'Chinese':
+                            include_flag = 1  # 对于中文，因为没有分词长度，所以全部保留
+                        break
+                if include_flag:
+                    temp['tokens'] = []
+                    for j in range(len(conll.split('\n')))[i + 2:]:
+                        temp['tokens'].append(conll.split('\n')[j].split()[1])
+                    doc_data.append(temp)
+
+        # 读取entity, event, relation
+        file_path = r'cache_data/' + language + '/' + file + '.v2.json'
+        with open(file_path) as f:
+            v2_data = json.loads(f.read())
+            for sentence in doc_data:
+                sent_id = sentence['sent_id']
+                sentence['golden-entity-mentions'] = []  # 添加实体
+                sentence['golden-event-mentions'] = []  # 添加事件
+                sentence['golden-relation-mentions'] = []  # 添加关系
+                for entity in v2_data['entities']:
+                    if entity['sent_id'] == sent_id:
+                        sentence['golden-entity-mentions'].append(entity)
+                for event in v2_data['events']:
+                    if event['sent_id'] == sent_id:
+                        sentence['golden-event-mentions'].append(event)
+                for relation in v2_data['relations']:
+                    if relation['sent_id'] == sent_id:
+                        sentence['golden-relation-mentions'].append(relation)
+                del sentence['sent_id']  # 删除sent_id
+        data += doc_data
+    return data
+
+
+def get_entity_tag(raw_data):
+    """get entity_tag for each token from data (not BIO type)"""
+    entity_tag = []
+    for sent in raw_data:
+        sent_tag = []
+        for i in range(len(sent['tokens'])):
+            sent_tag.append(['O'])
+        entity_tag.append(sent_tag)  # because of overlap,get a tag list for each token
+    for i in range(len(raw_data)):
+        temp_sent = raw_data[i]
+        temp_entity_mentions = temp_sent['golden-entity-mentions']
+        if len(temp_entity_mentions) == 0:  # skip if none
+            continue
+        type_list = []
+        position_list = []
+        length_list = []
+        for entity in temp_entity_mentions:
+            type_list.append(entity['entity-type'])
+            position_list.append(
+                [entity['position'][0], entity['position'][1] + 1])  # plus 1 to make sure not empty
+            length_list.append(entity['position'][1] - entity['position'][0] + 1)
+        length_list = np.array(length_list)
+        index = np.argsort(length_list)[::-1]  # get the length idx from long to short
+        for idx in index:
+            temp_start = position_list[idx][0]
+            for k in range(length_list[idx]):
+                if k == 0:
+                    entity_tag[i][temp_start + k] += ['B-'+type_list[idx]]
+                else:
+                    entity_tag[i][temp_start + k] += ['I-'+type_list[idx]]
+                # entity_tag[i][position_list[idx][0]: position_list[idx][1]] = [type_list[idx]] * int(length_list[idx])
+    for sent in entity_tag:  # delete 'O' if token is a named entity
+        for token in sent:
+            if len(token) > 1:
+                del token[0]
+    return entity_tag
@@ -0,0 +1,82 @@
+import os
+import time
+import multiprocessing
+from collections import deque
+
+
+def pool_context():
+    """Start method of the worker pools. The parents have pipeline, writer and tqdm threads
+    running, and forking them could copy a lock held by one of those threads into a worker,
+    so workers are started by a fork server (or spawned where there is none)."""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def largest_first(items, costs):
+    """Order `items` by decreasing estimated cost (longest-processing-time-first)."""
+    order = sorted(range(len(items)), key=lambda i: costs[i], reverse=True)
+    return [items[i] for i in order]
+
+
+def _timed_call(args):
+    fn, item = args
+    start = time.time()
+    result = fn(item)
+    return result, os.getpid(), time.time() - start
+
+
+def run_scheduled(fn, items, costs, workers, initializer=None, initargs=()):
+    """Yield `fn(item)` for every item, computed by a pool of `workers` processes.
+
+    Items are dispatched largest estimated cost first, one at a time, so an idle worker
+    always takes the next document instead of waiting behind a fixed chunk; the longest
+    documents start early and the tail of the split consists of short ones. Results
+    come in completion order. A per-worker utilization summary is printed at the end.
+    `fn` must be picklable, i.e. a module level function; workers inherit nothing from
+    the parent (see `pool_context`), `initializer` sets up their state.
+    """
+    busy = {}
+    tasks = {}
+    start = time.time()
+    with pool_context().Pool(workers, initializer=initializer, initargs=initargs) as pool:
+        jobs = [(fn, item) for item in largest_first(items, costs)]
+        for result, pid, elapsed in pool.imap_unordered(_timed_call, jobs, chunksize=1):
+            busy[pid] = busy.get(pid, 0.) + elapsed
+            tasks[pid] = tasks.get(pid, 0) + 1
+            yield result
+    print_utilization(busy, tasks, time.time() - start)
+
+
+def run_ordered(fn, items, workers, window=None, unit='docs', initializer=None, initargs=()):
+    """Yield `fn(item)` for every item in the order of `items`, computed by a pool of `workers` processes.
+
+    Unlike `run_scheduled`, the output is deterministic and `items` may be a generator:
+    at most `window` (default 2 * workers) items are submitted but not yet yielded, so
+    only that many inputs and results are held in memory whatever the corpus size.
+    """
+    window = window or 2 * workers
+    busy = {}
+    tasks = {}
+    start = time.time()
+    with pool_context().Pool(workers, initializer=initializer, initargs=initargs) as pool:
+        pending = deque()
+        items = iter(items)
+        while True:
+            for item in items:
+                pending.append(pool.apply_async(_timed_call, ((fn, item),)))
+                if len(pending) >= window:
+                    break
+            if not pending:
+                break
+            result, pid, elapsed = pending.popleft().get()
+            busy[pid] = busy.get(pid, 0.) + elapsed
+            tasks[pid] = tasks.get(pid, 0) + 1
+            yield result
+    print_utilization(busy, tasks, time.time() - start, unit)
+
+
+def print_utilization(busy, tasks, wall_time, unit='docs'):
+    print('[Workers] wall time {:.1f}s'.format(wall_time))
+    for idx, pid in enumerate(sorted(busy)):
+        print('  worker {:>2} (pid {:>6}): {:>4} {}, busy {:>7.1f}s, utilization {:>5.1%}'.format(
+            idx, pid, tasks[pid], unit, busy[pid], busy[pid] / wall_time if wall_time > 0 else 0.))
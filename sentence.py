@@ -0,0 +1,149 @@
+import sys
+from array import array
+
+
+class StringTable:
+    """Intern strings of a small closed set (UPOS tags, dependency relations) as integer ids."""
+
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+
+    def add(self, s):
+        idx = self.ids.get(s)
+        if idx is None:
+            idx = len(self.strings)
+            self.ids[s] = idx
+            self.strings.append(s)
+        return idx
+
+    def __getitem__(self, idx):
+        return self.strings[idx]
+
+
+# shared by every sentence of the process, the tag sets are tiny
+upos_table = StringTable()
+deprel_table = StringTable()
+
+
+class OffsetView:
+    """Read-only sequence of (start, end) character offsets backed by two int arrays."""
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, starts, ends):
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [(s, e) for s, e in zip(self.starts[idx], self.ends[idx])]
+        return self.starts[idx], self.ends[idx]
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+
+class TableView:
+    """Read-only sequence of strings stored as ids into a `StringTable`."""
+    __slots__ = ('ids', 'table')
+
+    def __init__(self, ids, table):
+        self.ids = ids
+        self.table = table
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self.table[i] for i in self.ids[idx]]
+        return self.table[self.ids[idx]]
+
+    def __iter__(self):
+        return (self.table[i] for i in self.ids)
+
+
+class Sentence:
+    """Compact sentence of a CoNLL-U file.
+
+    Token offsets and heads live in `array('i')`, UPOS tags and dependency relations
+    are ids into the shared string tables and word forms are interned. The object can
+    be read like the `OrderedDict` that `load_conllu` used to return, i.e.
+    `sent['word']`, `sent['offset'][i][0]`, `sent.get('id')` and `sent.items()` work.
+    A missing head or offset is stored as -1.
+    """
+    __slots__ = ('id', 'text', 'words', 'upos_ids', 'heads', 'deprel_ids', 'starts', 'ends')
+    keys_ = ('id', 'text', 'word', 'upos', 'head', 'deprel', 'offset')
+
+    def __init__(self, sent_id, text):
+        self.id = sent_id
+        self.text = text
+        self.words = []
+        self.upos_ids = array('H')
+        self.heads = array('i')
+        self.deprel_ids = array('H')
+        self.starts = array('i')
+        self.ends = array('i')
+
+    def append(self, word, upos, head, deprel, start, end):
+        self.words.append(sys.intern(word))
+        self.upos_ids.append(upos_table.add(upos))
+        self.heads.append(-1 if head is None else head)
+        self.deprel_ids.append(deprel_table.add(deprel))
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def freeze(self):
+        """Turn the word list into a tuple once the sentence is complete."""
+        self.words = tuple(self.words)
+        return self
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, key):
+        if key == 'id':
+            return self.id
+        elif key == 'text':
+            return self.text
+        elif key == 'word':
+            return self.words
+        elif key == 'upos':
+            return TableView(self.upos_ids, upos_table)
+        elif key == 'head':
+            return self.heads
+        elif key == 'deprel':
+            return TableView(self.deprel_ids, deprel_table)
+        elif key == 'offset':
+            return OffsetView(self.starts, self.ends)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.keys_
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.keys_
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys_]
+
+    def to_dict(self):
+        """Plain python version, same layout as the former `OrderedDict` objects."""
+        return {
+            'id': self.id,
+            'text': self.text,
+            'word': list(self.words),
+            'upos': list(self['upos']),
+            'head': list(self.heads),
+            'deprel': list(self['deprel']),
+            'offset': [[s, e] for s, e in zip(self.starts, self.ends)]
+        }
@@ -0,0 +1,68 @@
+import io
+from conllu import parse
+from conllu_reader import iter_conllu, conllu_columns, is_word, token_range
+from extract import load_conllu
+
+# multi-word tokens, `_` heads, words without TokenRange and an empty node
+sample = '''# newdoc id = doc
+# sent_id = doc-1
+# text = I don't know.
+1\tI\tI\tPRON\tPRP\t_\t3\tnsubj\t_\tTokenRange=0:1
+2-3\tdon't\t_\t_\t_\t_\t_\t_\t_\tTokenRange=2:7
+2\tdo\tdo\tAUX\tVBP\t_\t4\taux\t_\t_
+3\tn't\tnot\tPART\tRB\t_\t4\tadvmod\t_\t_
+4\tknow\tknow\tVERB\tVB\t_\t0\troot\t_\tTokenRange=8:12|SpaceAfter=No
+5\t.\t.\tPUNCT\t.\t_\t4\tpunct\t_\tTokenRange=12:13
+
+# sent_id = doc-2
+# text = Yes
+1\tYes\tyes\tINTJ\tUH\t_\t_\t_\t_\t_
+1.1\tsaid\tsay\tVERB\tVBD\t_\t_\t_\t_\t_
+
+'''
+
+
+def format_id(token_id):
+    """CoNLL-U spelling of a token id parsed by the conllu package."""
+    if isinstance(token_id, tuple):
+        return ''.join(str(part) for part in token_id)
+    return str(token_id)
+
+
+def test_iter_conllu_matches_conllu_parse():
+    expected = parse(sample)
+    sentences = list(iter_conllu(io.StringIO(sample), conllu_columns[1:]))
+    assert len(sentences) == len(expected)
+    for sent, tokens in zip(sentences, expected):
+        assert sent.metadata == tokens.metadata
+        assert sent.ids == [format_id(token['id']) for token in tokens]
+        assert sent.columns['form'] == [token['form'] for token in tokens]
+        assert sent.columns['upos'] == [token['upos'] or '_' for token in tokens]
+        assert [None if head == '_' else int(head) for head in sent.columns['head']] == \
+               [token['head'] for token in tokens]
+        assert [token_range(misc) for misc in sent.columns['misc']] == \
+               [[int(i) for i in token['misc']['TokenRange'].split(':')]
+                if token['misc'] and 'TokenRange' in token['misc'] else [-1, -1] for token in tokens]
+
+
+def test_iter_conllu_keeps_requested_columns():
+    sent = next(iter_conllu(io.StringIO(sample)))
+    assert list(sent.columns) == ['form']
+    assert len(sent) == 6
+    assert [is_word(token_id) for token_id in sent.ids] == [True, False, True, True, True, True]
+
+
+def test_load_conllu_offsets_and_heads(tmp_path):
+    path = tmp_path / 'doc.conllu'
+    path.write_text(sample, encoding='utf-8')
+    first, second = load_conllu(str(path))
+    assert (first['id'], first['text']) == ('doc-1', "I don't know.")
+    assert list(first['word']) == ['I', 'do', "n't", 'know', '.']
+    # only the first word of a multi-word token gets its range
+    assert [list(offset) for offset in first['offset']] == [[0, 1], [2, 7], [-1, -1], [8, 12], [12, 13]]
+    assert list(first['head']) == [3, 4, 4, 0, 4]
+    assert list(first['upos']) == ['PRON', 'AUX', 'PART', 'VERB', 'PUNCT']
+    # empty nodes are skipped, a missing head is -1
+    assert list(second['word']) == ['Yes']
+    assert list(second['head']) == [-1]
+    assert [list(offset) for offset in second['offset']] == [[-1, -1]]
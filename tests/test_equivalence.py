@@ -0,0 +1,27 @@
+import argparse
+from equivalence import Raised, Report, check_span, iter_documents
+
+
+def synthetic_options(documents):
+    return argparse.Namespace(check='span', lang='en', synthetic=documents, seed=1, tokenizer='regex',
+                              max_report=1000)
+
+
+def test_span_check_reports_exceptions_as_mismatches(capsys):
+    opt = synthetic_options(20)
+    mismatches = check_span(opt)
+    out = capsys.readouterr().out
+    # the synthetic corpus has whitespace-only mentions, on which the reference raises
+    assert 'reference: raised IndexError' in out
+    assert '[find_span_offset] compared 800' in out
+    blank = sum(1 for _, _, mentions in iter_documents(opt) for mention in mentions if not mention['text'].strip())
+    assert 0 < mismatches <= blank
+
+
+def test_raised_results_compare_by_type():
+    report = Report('check', max_report=0)
+    reference, current = report.timed(lambda: [][0], lambda: (None, -1, -1), catch=True)
+    assert isinstance(reference, Raised) and current == (None, -1, -1)
+    report.compare('mention', reference, current)
+    report.compare('mention', Raised(IndexError('a')), Raised(IndexError('b')))
+    assert (report.compared, report.mismatches) == (2, 1)
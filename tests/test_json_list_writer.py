@@ -0,0 +1,59 @@
+import os
+import pytest
+from transform import JsonListWriter, save_data
+
+items = [{'sentence': 'a b', 'words': ['a', 'b'], 'events': []},
+         {'sentence': 'c', 'words': ['c'], 'events': [{'trigger': [0, 1]}]},
+         {'sentence': '', 'words': [], 'events': []}]
+
+
+def write(path, data, pretty, newline, append=None):
+    writer = JsonListWriter(str(path), pretty, append, newline)
+    for item in data:
+        writer.write(item)
+    writer.close()
+    return os.path.getsize(str(path))
+
+
+@pytest.mark.parametrize('pretty', [True, False])
+def test_full_write_matches_save_data(tmp_path, pretty):
+    for data in [items, []]:
+        write(tmp_path / 'list.json', data, pretty, True)
+        save_data(data, str(tmp_path / 'saved.json'), pretty)
+        assert (tmp_path / 'list.json').read_bytes() == (tmp_path / 'saved.json').read_bytes()
+
+
+@pytest.mark.parametrize('pretty', [True, False])
+def test_bio_files_have_no_final_newline(tmp_path, pretty):
+    for data in [items, []]:
+        write(tmp_path / 'list.json', data, pretty, False)
+        save_data(data, str(tmp_path / 'saved.json'), pretty)
+        assert (tmp_path / 'list.json').read_bytes() + b'\n' == (tmp_path / 'saved.json').read_bytes()
+
+
+@pytest.mark.parametrize('pretty', [True, False])
+@pytest.mark.parametrize('newline', [True, False])
+@pytest.mark.parametrize('split', [0, 1, 3])
+def test_append_matches_full_write(tmp_path, pretty, newline, split):
+    write(tmp_path / 'full.json', items, pretty, newline)
+    size = write(tmp_path / 'parts.json', items[:split], pretty, newline)
+    write(tmp_path / 'parts.json', items[split:], pretty, newline, append=size)
+    assert (tmp_path / 'parts.json').read_bytes() == (tmp_path / 'full.json').read_bytes()
+
+
+@pytest.mark.parametrize('pretty', [True, False])
+def test_append_drops_interrupted_append(tmp_path, pretty):
+    write(tmp_path / 'full.json', items, pretty, True)
+    size = write(tmp_path / 'parts.json', items[:1], pretty, True)
+    with open(str(tmp_path / 'parts.json'), 'a', encoding='utf8') as f:
+        f.write(',\n  {"sentence": "c", "wor')
+    write(tmp_path / 'parts.json', items[1:], pretty, True, append=size)
+    assert (tmp_path / 'parts.json').read_bytes() == (tmp_path / 'full.json').read_bytes()
+
+
+def test_append_to_truncated_file_fails(tmp_path):
+    size = write(tmp_path / 'list.json', items, True, True)
+    with open(str(tmp_path / 'list.json'), 'r+b') as f:
+        f.truncate(size - 3)
+    with pytest.raises(Exception):
+        JsonListWriter(str(tmp_path / 'list.json'), True, size)
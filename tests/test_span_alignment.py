@@ -0,0 +1,84 @@
+import pytest
+import reference
+from extract import find_span_offset, find_tokenized_windows
+from sentence import Sentence
+from tokenization import RegexTokenizer
+
+model = RegexTokenizer('en')
+
+
+def make_sentences(*sentences):
+    """Sentences of words separated by one space, as `load_conllu` returns them."""
+    result = []
+    pos = 0
+    for idx, words in enumerate(sentences):
+        sent = Sentence(str(idx + 1), ' '.join(words))
+        for word in words:
+            sent.append(word, 'X', 0, 'dep', pos, pos + len(word))
+            pos += len(word) + 1
+        result.append(sent.freeze())
+    return result
+
+
+def span(fn, sentences, text, start, end):
+    result = fn(sentences, text, start, end, model, 'en')
+    return result['sent_id'], result['start'], result['end']
+
+
+def window_loop(words, text_len, tokenized_text):
+    """Window starts of the original loop of reference.find_span_offset."""
+    starts = []
+    for i in range(len(words) - text_len + 1):
+        if tokenized_text in ' '.join(words[i:i + text_len]):
+            starts.append(i)
+    return starts
+
+
+@pytest.mark.parametrize('words, text_words', [
+    (['New', 'York', 'and', 'New', 'York', 'City'], ['New', 'York']),
+    (['my', "ex's", 'car'], ['my', 'ex']),
+    (['Nashville', ',', 'Tenn.', 'and', 'Nashville', ',', 'Tenn'], ['Nashville', ',', 'Tenn']),
+    (['a', 'b', 'a', 'b', 'a'], ['a', 'b', 'a']),
+    (['the', 'army'], ['the', 'army', 'soldiers']),
+])
+def test_windows_match_the_window_loop(words, text_words):
+    tokenized_text = ' '.join(text_words)
+    starts = find_tokenized_windows(words, len(text_words), tokenized_text)
+    expected = window_loop(words, len(text_words), tokenized_text)
+    assert (starts or []) == expected
+    # None only when the text is not in the joined words at all
+    assert (starts is None) == (tokenized_text not in ' '.join(words))
+
+
+def test_empty_text_matches_no_window():
+    assert find_tokenized_windows(['a', 'b'], 0, '') == []
+    # the original loop also matches the start past the last word, whose offset does not exist
+    assert window_loop(['a', 'b'], 0, '') == [0, 1, 2]
+
+
+def test_whitespace_mention_is_not_aligned():
+    sentences = make_sentences(['the', 'army', 'in', 'the', 'Persian', 'Gulf'])
+    # the spaces between `in` and `the`, off the word boundaries
+    with pytest.raises(IndexError):
+        span(reference.find_span_offset, sentences, ' ', 11, 11)
+    assert span(find_span_offset, sentences, ' ', 11, 11) == ('1', -1, -1)
+
+
+def test_absent_text_is_not_aligned():
+    sentences = make_sentences(['the', 'army', 'in', 'the', 'Persian', 'Gulf'])
+    expected = span(reference.find_span_offset, sentences, 'navy fleet', 5, 14)
+    assert span(find_span_offset, sentences, 'navy fleet', 5, 14) == expected == ('1', -1, -1)
+
+
+@pytest.mark.parametrize('text, start, end, expected', [
+    # offsets off the word boundaries, so only the tokenized text can match;
+    # with two windows, the closest to the mention start wins
+    ('New York', 15, 19, ('1', 3, 4)),
+    ('New York', 2, 6, ('1', 0, 1)),
+    # the text is only part of its window
+    ('my ex', 28, 32, ('2', 0, 1)),
+])
+def test_tokenized_windows_match_reference(text, start, end, expected):
+    sentences = make_sentences(['New', 'York', 'and', 'New', 'York', 'City'], ['my', "ex's", 'car'])
+    assert span(reference.find_span_offset, sentences, text, start, end) == expected
+    assert span(find_span_offset, sentences, text, start, end) == expected
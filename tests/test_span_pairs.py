@@ -0,0 +1,75 @@
+import io
+import json
+import numpy as np
+import pytest
+from build_BIO import NpyRowWriter, npy_header, save_span_pairs, span_pair_array, label_files
+
+pairs = [(0, [0, 0], [2, 3], 'PHYS:Located'), (0, [2, 3], [5, 5], 'ORG-AFF:Employment'),
+         (3, [1, 1], [4, 6], 'PHYS:Located'), (7, [0, 2], [3, 3], 'PART-WHOLE:Subsidiary')]
+arguments = [(1, [2, 2], [0, 0], 'Attacker'), (4, [1, 1], [3, 4], 'Place')]
+
+
+def test_header_matches_np_save():
+    for shape in [(0, 6), (9, 6), (123456, 6)]:
+        f = io.BytesIO()
+        np.save(f, np.zeros(shape, dtype=np.int64))
+        data = f.getvalue()
+        size = len(data) - shape[0] * shape[1] * 8
+        assert npy_header(shape, size) == data[:size]
+
+
+def test_writer_matches_np_save(tmp_path):
+    rows = np.arange(60, dtype=np.int64).reshape(10, 6)
+    writer = NpyRowWriter(str(tmp_path / 'a.npy'), 6)
+    writer.write(rows[:3])
+    writer.write(rows[3:])
+    assert writer.close() == 10
+    np.save(str(tmp_path / 'b.npy'), rows)
+    assert (tmp_path / 'a.npy').read_bytes() == (tmp_path / 'b.npy').read_bytes()
+
+
+def test_append_drops_rows_of_an_interrupted_write(tmp_path):
+    rows = np.arange(120, dtype=np.int64).reshape(20, 6)
+    np.save(str(tmp_path / 'a.npy'), rows[:8])
+    with open(str(tmp_path / 'a.npy'), 'ab') as f:
+        f.write(rows[:2].tobytes())
+    writer = NpyRowWriter(str(tmp_path / 'a.npy'), 6, append=8)
+    writer.write(rows[8:])
+    assert writer.close() == 20
+    np.save(str(tmp_path / 'b.npy'), rows)
+    assert (tmp_path / 'a.npy').read_bytes() == (tmp_path / 'b.npy').read_bytes()
+
+
+def test_append_to_a_shorter_array_fails(tmp_path):
+    np.save(str(tmp_path / 'a.npy'), np.zeros((3, 6), dtype=np.int64))
+    with pytest.raises(Exception):
+        NpyRowWriter(str(tmp_path / 'a.npy'), 6, append=4)
+
+
+def save(tmp_path, relations, args, append_rows=None):
+    return save_span_pairs((span_pair_array(relations), span_pair_array(args)),
+                           str(tmp_path) + '/', str(tmp_path / 'train') + '/', append_rows)
+
+
+def load_pairs(tmp_path):
+    """Rows of both arrays with the label ids replaced by the labels."""
+    result = []
+    for name, file in zip(['relations.npy', 'event_arguments.npy'], label_files):
+        labels = json.loads((tmp_path / file).read_text())
+        result.append([tuple(row[:5]) + (labels[row[5]],) for row in np.load(str(tmp_path / 'train' / name))])
+    return result
+
+
+def test_append_matches_full_save(tmp_path):
+    (tmp_path / 'train').mkdir()
+    assert save(tmp_path, pairs, arguments) == {'relations': 4, 'event_arguments': 2}
+    full = load_pairs(tmp_path)
+    for file in label_files:
+        (tmp_path / file).unlink()
+    rows = save(tmp_path, pairs[:2], [])
+    assert save(tmp_path, pairs[2:], arguments, rows) == {'relations': 4, 'event_arguments': 2}
+    assert load_pairs(tmp_path) == full
+    # a label first seen in the appended rows is added at the end of the list
+    assert json.loads((tmp_path / label_files[0]).read_text()) == \
+        ['ORG-AFF:Employment', 'PHYS:Located', 'PART-WHOLE:Subsidiary']
+    assert not [path.name for path in (tmp_path / 'train').iterdir() if path.name.startswith('.')]
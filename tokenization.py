@@ -0,0 +1,168 @@
+"""Tokenizer backends used to annotate the documents and by the alignment fallbacks.
+
+A backend has the interface of `udpipe.Model` that format.py and extract.py use:
+`tokenize(text, 'ranges')` returns sentences with a `words` list, `tag`/`parse` annotate
+a sentence in place, and `write(sentences, 'conllu')` returns CoNLL-U text whose words
+carry `TokenRange=start:end` character offsets into `text` (end exclusive).
+
+    udpipe  UDPipe model, tokenizes, tags and parses (needs the model files)
+    regex   rule-based word and sentence tokenizer for English and Arabic
+    char    character-level tokenizer for Chinese, ASCII letters and digits stay together
+
+The rule-based backends only tokenize: UPOS, head and deprel are `_` in their output.
+"""
+import re
+from abc import ABC, abstractmethod
+
+backends = ['udpipe', 'regex', 'char']
+
+# paragraphs are separated by empty lines, like with the UDPipe tokenizer
+paragraph_break = re.compile(r'\n[ \t\r\f\v]*\n\s*')
+
+
+class RuleSentence:
+    """A tokenized sentence: the forms of its words and their character offsets."""
+
+    def __init__(self, new_par):
+        self.new_par = new_par
+        self.words = []
+        self.starts = []
+        self.ends = []
+
+    def append(self, word, start, end):
+        self.words.append(word)
+        self.starts.append(start)
+        self.ends.append(end)
+
+
+class RuleTokenizer(ABC):
+    """Base of the rule-based backends, subclasses define `token_pattern` and `is_sentence_end`."""
+
+    token_pattern = None
+    # closing quotes and brackets directly after the end of a sentence stay in it
+    closing = re.compile(r'^["\'”’»)\]}」』）》]+$')
+
+    @abstractmethod
+    def is_sentence_end(self, words, idx, next_word):
+        """Whether the sentence ends after `words[idx]`, followed by `next_word`."""
+
+    def tokenize(self, text, *args):
+        sentences = []
+        start = 0
+        for match in list(paragraph_break.finditer(text)) + [None]:
+            end = len(text) if match is None else match.start()
+            self._tokenize_paragraph(text, start, end, sentences)
+            if match is not None:
+                start = match.end()
+        return sentences
+
+    def _tokenize_paragraph(self, text, start, end, sentences):
+        tokens = [(m.group(), m.start(), m.end()) for m in self.token_pattern.finditer(text, start, end)]
+        sentence = RuleSentence(new_par=True)
+        for idx, (word, token_start, token_end) in enumerate(tokens):
+            sentence.append(word, token_start, token_end)
+            if idx + 1 == len(tokens):
+                sentences.append(sentence)
+                break
+            next_word, next_start, _ = tokens[idx + 1]
+            closed_by_next = next_start == token_end and self.closing.match(next_word)
+            if not closed_by_next and self.is_sentence_end(sentence.words, len(sentence.words) - 1, next_word):
+                sentences.append(sentence)
+                sentence = RuleSentence(new_par=False)
+
+    def tag(self, sentence):
+        pass
+
+    def parse(self, sentence):
+        pass
+
+    def write(self, sentences, out_format):
+        if out_format != 'conllu':
+            raise Exception("Output format '%s' is not supported by the rule-based tokenizers" % out_format)
+        lines = []
+        for sent_id, sentence in enumerate(sentences, 1):
+            if sent_id == 1:
+                lines.append('# newdoc')
+            if sentence.new_par:
+                lines.append('# newpar')
+            words = []
+            text = ''
+            for idx, word in enumerate(sentence.words):
+                misc = 'TokenRange={}:{}'.format(sentence.starts[idx], sentence.ends[idx])
+                text += word
+                if idx + 1 < len(sentence.words):
+                    if sentence.ends[idx] == sentence.starts[idx + 1]:
+                        misc = 'SpaceAfter=No|' + misc
+                    else:
+                        text += ' '
+                words.append('{}\t{}\t_\t_\t_\t_\t_\t_\t_\t{}'.format(idx + 1, word, misc))
+            lines.append('# sent_id = {}'.format(sent_id))
+            lines.append('# text = {}'.format(text))
+            lines.extend(words)
+            lines.append('')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+class RegexTokenizer(RuleTokenizer):
+    """Words, numbers, English clitics and single punctuation marks; sentences end at . ! ? ؟"""
+
+    abbreviations = ('Mr|Mrs|Ms|Dr|Prof|St|Jr|Sr|Gen|Sen|Rep|Gov|Lt|Col|Sgt|Capt|Rev|Inc|Corp|Co|Ltd|'
+                     'vs|etc|No|Jan|Feb|Mar|Apr|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec')
+    token_pattern = re.compile(r"""
+        (?:[A-Za-z]\.){2,}                          # U.S., e.g.
+      | (?:%s)\.(?=\s|$)                            # Mr.
+      | \d+(?:[.,:/]\d+)*                           # 1,000.5 10:30 1/2
+      | \w+(?=n['’]t\b)                             # do of don't
+      | \w+(?=(?i:['’](?:s|re|ve|ll|d|m))\b)        # John of John's
+      | n['’]t\b
+      | (?i:['’](?:s|re|ve|ll|d|m)\b)               # 's 're ...
+      | \w+(?:[-@&]\w+|['’](?!(?i:s|re|ve|ll|d|m)\b)\w+)*  # words, O'Brien, well-known
+      | [^\w\s]                                     # punctuation
+    """ % abbreviations, re.VERBOSE)
+    sentence_final = {'.', '!', '?', '؟'}
+
+    def __init__(self, lang='en'):
+        self.lang = lang
+
+    def is_sentence_end(self, words, idx, next_word):
+        if words[idx] not in self.sentence_final:
+            word = words[idx - 1] if self.closing.match(words[idx]) and idx > 0 else None
+            if word not in self.sentence_final:
+                return False
+        # English sentences start with a capital letter, a digit or a quote
+        return self.lang != 'en' or not next_word[0].islower()
+
+
+class CharTokenizer(RuleTokenizer):
+    """Every CJK character is a word, runs of ASCII letters and digits are kept together."""
+
+    token_pattern = re.compile(r'[A-Za-z0-9]+(?:[.,:][0-9]+)*|\S')
+    sentence_final = re.compile(r'^(?:[。！？!?；]|…+)$')
+
+    def is_sentence_end(self, words, idx, next_word):
+        if self.sentence_final.match(words[idx]):
+            return True
+        return self.closing.match(words[idx]) is not None and idx > 0 and \
+            self.sentence_final.match(words[idx - 1]) is not None
+
+
+def count_words(sentence):
+    """Words of a tokenized sentence as counted by the #Words statistics of format.py.
+
+    The `words` of a UDPipe sentence start with the technical root, so UDPipe counts
+    have always included one root per sentence; a rule-based sentence counts one as
+    well, to keep the statistics comparable across backends.
+    """
+    return len(sentence.words) + (1 if isinstance(sentence, RuleSentence) else 0)
+
+
+def load_tokenizer(backend, lang, model_path):
+    """Tokenizer `backend` for `lang`; `model_path` is the UDPipe model, only loaded by the udpipe backend."""
+    if backend == 'udpipe':
+        from udpipe import Model
+        return Model(model_path)
+    if backend == 'regex':
+        return RegexTokenizer(lang)
+    if backend == 'char':
+        return CharTokenizer()
+    raise Exception("Unknown tokenizer backend '%s'" % backend)
@@ -1,8 +1,17 @@
-import json
+import jsonio
 import pandas as pd
 import numpy as np
 import random
 import argparse
+import io
+import os
+from collections import OrderedDict
+from fileio import open_file, find_file, compressed_name, remove_variants, atomic_write
+from conllu_reader import iter_conllu, token_range
+from profiling import Profiler
+from scheduler import run_ordered
+from build_BIO import get_sentence_tags, iter_sentence_tags, get_sentence_span_pairs, SpanPairWriter, \
+    reset_labels
 
 lang_name = {
     'en': 'English',
@@ -10,8 +19,8 @@ lang_name = {
     'zh': 'Chinese'
 }
 
-def load_file_list(language='en', name='train'):
-    file_list_path = 'filelist/ace.' + language + '.' + name + '.txt'
+def load_file_list(language='en', name='train', filelist='filelist/'):
+    file_list_path = os.path.join(filelist, 'ace.' + language + '.' + name + '.txt')
     file_list = []
     with open(file_list_path) as f:
         for line in f.readlines():
@@ -20,51 +29,117 @@ def load_file_list(language='en', name='train'):
     return file_list
 
 
-def load_processed_data(file_list, language='English', name='train'):
-    data = []
+def cache_file(language, file, suffix):
+    """Cached file of a document, cache_data/ is keyed by document id only so splits can change freely."""
+    return find_file(r'cache_data/' + language + '/' + file + suffix)
+
+
+def missing_documents(file_list, language='English'):
+    return [file for file in file_list if not os.path.exists(cache_file(language, file, '.v2.json'))]
+
+
+# optional per-token output fields, parallel to 'tokens'
+token_fields = {
+    'offsets': ['token-start', 'token-end'],
+    'ud': ['upos', 'feats', 'head', 'deprel']
+}
+
+
+# CoNLL-U columns read for each of `token_fields`
+field_columns = {
+    'offsets': ['misc'],
+    'ud': ['upos', 'feats', 'head', 'deprel']
+}
+
+
+def add_token_fields(sentence, conll, fields):
+    """Add the `fields` (keys of `token_fields`) of the CoNLL-U sentence `conll` to `sentence`.
+
+    Offsets are the TokenRange character offsets into the document text (end exclusive),
+    -1 when missing; a missing head is -1 as well.
+    """
+    if 'offsets' in fields:
+        offsets = [token_range(misc) for misc in conll.columns['misc']]
+        sentence['token-start'] = [offset[0] for offset in offsets]
+        sentence['token-end'] = [offset[1] for offset in offsets]
+    if 'ud' in fields:
+        sentence['upos'] = conll.columns['upos']
+        sentence['feats'] = conll.columns['feats']
+        sentence['head'] = [-1 if head == '_' else int(head) for head in conll.columns['head']]
+        sentence['deprel'] = conll.columns['deprel']
+
+
+def iter_processed_documents(file_list, language='English', fields=()):
+    """Yield the sentences of one document at a time, see `load_processed_data`."""
+    columns = ['form'] + [column for field in fields for column in field_columns[field]]
     # 读取句子和tokens
     for file in file_list:
         doc_data = []
-        conll_path = r'cache_data/' + language + '/' + name + '/' + file + '.conllu'
-        with open(conll_path) as f:
-            conll_list = f.read().split('\n\n')
-            for conll in conll_list:
-                include_flag = 0  # 是否记录标记
-                for i in range(len(conll.split('\n'))):
-                    if 'sent_id = ' in conll.split('\n')[i]:
-                        temp = dict()
-                        temp['sent_id'] = conll.split('\n')[i].split()[-1]
-                        temp['sentence'] = conll.split('\n')[i + 1][9:]
-                        if len(temp['sentence'].split()) >= 5:  # TODO仅保留单词数大于5的句子
-                            include_flag = 1  # 是否记录标记
-                        elif language == 'Chinese':
-                            include_flag = 1  # 对于中文，因为没有分词长度，所以全部保留
-                        break
-                if include_flag:
-                    temp['tokens'] = []
-                    for j in range(len(conll.split('\n')))[i + 2:]:
-                        temp['tokens'].append(conll.split('\n')[j].split()[1])
+        conll_path = cache_file(language, file, '.conllu')
+        with open_file(conll_path) as f:
+            for conll in iter_conllu(f, columns):
+                if 'sent_id' not in conll.metadata:
+                    continue
+                temp = dict()
+                temp['sent_id'] = conll.metadata['sent_id']
+                temp['sentence'] = conll.metadata['text']
+                # TODO仅保留单词数大于5的句子; 对于中文，因为没有分词长度，所以全部保留
+                if len(temp['sentence'].split()) >= 5 or language == 'Chinese':
+                    # multi-word token ranges are kept as tokens too
+                    temp['tokens'] = conll.columns['form']
+                    if fields:
+                        add_token_fields(temp, conll, fields)
                     doc_data.append(temp)
 
         # 读取entity, event, relation
-        file_path = r'cache_data/' + language + '/' + name + '/' + file + '.v2.json'
-        with open(file_path) as f:
-            v2_data = json.loads(f.read())
-            for sentence in doc_data:
-                sent_id = sentence['sent_id']
-                sentence['golden-entity-mentions'] = []  # 添加实体
-                sentence['golden-event-mentions'] = []  # 添加事件
-                sentence['golden-relation-mentions'] = []  # 添加关系
-                for entity in v2_data['entities']:
-                    if entity['sent_id'] == sent_id:
-                        sentence['golden-entity-mentions'].append(entity)
-                for event in v2_data['events']:
-                    if event['sent_id'] == sent_id:
-                        sentence['golden-event-mentions'].append(event)
-                for relation in v2_data['relations']:
-                    if relation['sent_id'] == sent_id:
-                        sentence['golden-relation-mentions'].append(relation)
-                del sentence['sent_id']  # 删除sent_id
+        file_path = cache_file(language, file, '.v2.json')
+        with open_file(file_path) as f:
+            v2_data = jsonio.loads(f.read())
+        join_mentions(doc_data, v2_data)
+        yield doc_data
+
+
+def join_mentions(doc_data, v2_data):
+    """Attach the mentions of `v2_data` to the sentences with the same sent_id, in one pass."""
+    by_sent_id = dict()
+    for sentence in doc_data:
+        sentence['golden-entity-mentions'] = []  # 添加实体
+        sentence['golden-event-mentions'] = []  # 添加事件
+        sentence['golden-relation-mentions'] = []  # 添加关系
+        by_sent_id.setdefault(sentence.pop('sent_id'), []).append(sentence)
+    for key, field in [('entities', 'golden-entity-mentions'),
+                       ('events', 'golden-event-mentions'),
+                       ('relations', 'golden-relation-mentions')]:
+        for mention in v2_data[key]:
+            for sentence in by_sent_id.get(mention['sent_id'], []):
+                sentence[field].append(mention)
+
+
+def prepare_document(task):
+    """Sentences of one document and, with `bio`, their tags; the work of a `--workers` process."""
+    file, language, fields, bio = task
+    doc_data = next(iter_processed_documents([file], language, fields))
+    return doc_data, [get_sentence_tags(sent) for sent in doc_data] if bio else None
+
+
+def iter_documents(file_list, language='English', fields=(), bio=False, workers=1):
+    """Yield (sentences, tags) of every document in the order of `file_list`.
+
+    With workers > 1 the documents are read by a process pool, a few at a time, and the
+    tags of `get_sentence_tags` are computed there as well when `bio` is set. Otherwise
+    tags is None and the writer computes them.
+    """
+    if workers <= 1:
+        for doc_data in iter_processed_documents(file_list, language, fields):
+            yield doc_data, None
+        return
+    tasks = ((file, language, fields, bio) for file in file_list)
+    yield from run_ordered(prepare_document, tasks, workers)
+
+
+def load_processed_data(file_list, language='English', fields=(), workers=1):
+    data = []
+    for doc_data, _ in iter_documents(file_list, language, fields, workers=workers):
         data += doc_data
     return data
 
@@ -90,22 +165,15 @@ def count_type(language='English'):
 
             # 计算文本中句子数目
             doc_sent_len = 0
-            conll_path = r'cache_data/' + language + '/' + name + '/' + file + '.conllu'
-            with open(conll_path) as f:
-                conll_list = f.read().split('\n\n')
-                for conll in conll_list:
-                    for i in range(len(conll.split('\n'))):
-                        if 'sent_id = ' in conll.split('\n')[i]:
-                            temp = dict()
-                            temp['sent_id'] = conll.split('\n')[i].split()[-1]
-                            temp['sentence'] = conll.split('\n')[i + 1][9:]
-                            if len(temp['sentence'].split()) >= 5:  # TODO仅保留单词数大于5的句子
-                                doc_sent_len += 1
-                            break
-
-            file_path = r'cache_data/' + language + '/' + name + '/' + file + '.v2.json'
-            with open(file_path) as f:
-                v2_data = json.loads(f.read())
+            conll_path = cache_file(language, file, '.conllu')
+            with open_file(conll_path) as f:
+                for conll in iter_conllu(f, columns=()):
+                    if 'sent_id' in conll.metadata and len(conll.metadata['text'].split()) >= 5:  # TODO仅保留单词数大于5的句子
+                        doc_sent_len += 1
+
+            file_path = cache_file(language, file, '.v2.json')
+            with open_file(file_path) as f:
+                v2_data = jsonio.loads(f.read())
             for event in v2_data['events']:
                 event_count[event_type.index(event['event_type'])] += 1
             event_count[0] = doc_sent_len - sum(event_count)
@@ -119,25 +187,241 @@ def count_type(language='English'):
     type_df.to_csv('doc_type.csv')
 
 
-def save_data(data, path):
-    with open(path, 'w', encoding='utf8') as f:
-        f.write(json.dumps(data, indent=4, ensure_ascii=False) + '\n')
+def save_data(data, path, pretty=True):
+    with open_file(path, 'w', encoding='utf8') as f:
+        f.write(jsonio.dumps(data, pretty) + '\n')
+    remove_variants(path)
 
 
-def print_count(data):
-    len_data = len(data)
-    count = 0
-    multi_event_sent_count = 0
-    multi_same_event_sent_count = 0
-    for con in data:
-        count += len(con["golden-event-mentions"])
+def reopen_json_list(path, size):
+    """Open the uncompressed json list at `path` for appending: cut it back to the `size` bytes
+    of the last complete write, which drops what an interrupted append left behind, then cut
+    its closing bracket. Return the text file positioned at the end and whether the list has items."""
+    f = open(path, 'rb+')
+    if f.seek(0, os.SEEK_END) < size:
+        f.close()
+        raise Exception('%s is shorter than when it was last written' % path)
+    f.truncate(size)
+    f.seek(max(0, size - 4096))
+    tail = f.read()
+    if b']' not in tail:
+        f.close()
+        raise Exception('%s is not a json list' % path)
+    head = tail[:tail.rindex(b']')].rstrip()
+    has_items = not head.endswith(b'[')
+    f.truncate(size - len(tail) + len(head) if has_items else 0)
+    f.seek(0, os.SEEK_END)
+    return io.TextIOWrapper(f, encoding='utf8'), has_items
+
+
+class JsonListWriter:
+    """Write a json list one item at a time, producing the same text as `save_data`, or
+    without the final newline like the BIO files of build_BIO.py if not `newline`.
+
+    With `append`, the items are added to the existing list at `path` without reading it;
+    `append` is the size of the file when it was completely written.
+    """
+
+    def __init__(self, path, pretty=True, append=None, newline=True):
+        self.path = path
+        self.pretty = pretty
+        self.newline = '\n' if newline else ''
+        self.count = 0
+        if append is not None:
+            self.file, has_items = reopen_json_list(path, append)
+            self.count = int(has_items)
+        else:
+            self.file = open_file(path, 'w', encoding='utf8')
+            remove_variants(path)
+
+    def write(self, item):
+        text = jsonio.dumps(item, self.pretty)
+        if not self.pretty:
+            self.file.write(('[' if self.count == 0 else jsonio.separator) + text)
+        else:
+            self.file.write('[\n' if self.count == 0 else ',\n')
+            prefix = ' ' * jsonio.indent
+            self.file.write('\n'.join(prefix + line for line in text.split('\n')))
+        self.count += 1
+
+    def close(self):
+        if self.count == 0:
+            self.file.write('[]' + self.newline)
+        else:
+            self.file.write(('\n]' if self.pretty else ']') + self.newline)
+        self.file.close()
+
+
+class EventCounter:
+    """Incremental version of the statistics of `print_count`, `state` continues a previous count."""
+
+    keys = ['len_data', 'count', 'multi_event_sent_count', 'multi_same_event_sent_count']
+
+    def __init__(self, state=None):
+        for key in self.keys:
+            setattr(self, key, state[key] if state else 0)
+
+    def state(self):
+        return OrderedDict((key, getattr(self, key)) for key in self.keys)
+
+    def update(self, con):
+        self.len_data += 1
+        self.count += len(con["golden-event-mentions"])
         if len(con["golden-event-mentions"]) > 1:
-            multi_event_sent_count += 1
+            self.multi_event_sent_count += 1
             event_type = [event["event_type"] for event in con["golden-event-mentions"]]
             if len(set(event_type)) != len(event_type):
-                multi_same_event_sent_count += 1
-    print('[Total Sentence:] %d, [Total Event:]%d,\n [Multi-event-sentence:] %d, [Multi-same-event-sentence:] %d'
-          % (len_data, count, multi_event_sent_count, multi_same_event_sent_count))
+                self.multi_same_event_sent_count += 1
+
+    def print(self):
+        print('[Total Sentence:] %d, [Total Event:]%d,\n [Multi-event-sentence:] %d, [Multi-same-event-sentence:] %d'
+              % (self.len_data, self.count, self.multi_event_sent_count, self.multi_same_event_sent_count))
+
+
+def index_path(lang, name):
+    return r'output/' + str(lang) + '-' + name + '.index.json'
+
+
+def load_index(lang, name):
+    """The index of the outputs of a split, None if there is none."""
+    path = index_path(lang, name)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf8') as f:
+        return jsonio.loads(f.read())
+
+
+class SplitWriter:
+    """Write the selected outputs of a split in one traversal of its sentences.
+
+    `outputs` holds 'json' (output/<lang>-<split>.json), 'bio' (the files of build_BIO.py
+    in output/BIO/<split>/, including the `fields` of `token_fields`) and 'stats' (the
+    counts of `print_count`, printed by `close`). Nothing is kept per sentence, the span
+    pairs of the BIO outputs go to the temporary files of `SpanPairWriter`. Once all
+    outputs are complete, `close` writes the index output/<lang>-<split>.index.json:
+    the options, the `documents` read for the split, the number of sentences, the
+    statistics and the size of every output. With `append`, the sentences are added to the outputs described by the
+    index; the outputs are first cut back to the recorded sizes, so the leftovers of
+    an interrupted append are dropped. A full run deletes the index first, an
+    interrupted full run leaves none behind to append to.
+    """
+
+    def __init__(self, lang, name, outputs=('json', 'stats'), compress='none', pretty=True, fields=(),
+                 append=False, rate=None):
+        self.lang = lang
+        self.name = name
+        self.outputs = outputs
+        self.compress = compress
+        self.pretty = pretty
+        self.fields = fields
+        self.append = append
+        self.rate = rate
+        index = load_index(lang, name) if append else None
+        if not append and os.path.exists(index_path(lang, name)):
+            os.remove(index_path(lang, name))
+        self.documents = index['documents'] if index else []
+        self.sizes = index['sizes'] if index else dict()
+        self.rows = index['rows'] if index else None
+        self.writers = dict()
+        self.counter = EventCounter(index['stats'] if index else None)
+        self.bio = 'bio' in outputs
+        # sentence index of the span pair arrays
+        self.count = index['sentences'] if index else 0
+        if 'json' in outputs:
+            self.writers['json'] = JsonListWriter(
+                compressed_name(r'output/' + str(lang) + '-' + name + '.json', compress), pretty,
+                self.sizes['json'] if append else None)
+        if self.bio:
+            self.BIO_path = r'output/BIO/'
+            self.type_path = self.BIO_path + name + '/'
+            os.makedirs(self.type_path, exist_ok=True)
+            self.bio_fields = [key for field in fields for key in token_fields[field]]
+            for file in ['token', 'entity_BIO', 'event_trigger_BIO', 'event_argument_BIO'] + \
+                    [key.replace('-', '_') for key in self.bio_fields]:
+                self.writers[file] = JsonListWriter(
+                    compressed_name(self.type_path + file + '.json', compress), pretty,
+                    self.sizes[file] if append else None, newline=False)
+            self.span_pairs = SpanPairWriter(self.BIO_path, self.type_path, self.rows)
+
+    def write(self, sent, tags=None):
+        """Write one sentence, `tags` are its `get_sentence_tags` if already computed."""
+        if 'json' in self.writers:
+            self.writers['json'].write(sent)
+        self.counter.update(sent)
+        if self.bio:
+            entity_tag, trigger_tag, argument_tag = tags or get_sentence_tags(sent)
+            self.writers['token'].write(sent['tokens'])
+            self.writers['entity_BIO'].write(entity_tag)
+            self.writers['event_trigger_BIO'].write(trigger_tag)
+            self.writers['event_argument_BIO'].write(argument_tag)
+            for key in self.bio_fields:
+                self.writers[key.replace('-', '_')].write(sent[key])
+            relations, arguments = get_sentence_span_pairs(self.count, sent)
+            self.span_pairs.add('relations', relations)
+            self.span_pairs.add('event_arguments', arguments)
+        self.count += 1
+
+    def close(self):
+        sizes = dict()
+        for name, writer in self.writers.items():
+            writer.close()
+            sizes[name] = os.path.getsize(writer.path)
+        rows = None
+        if self.bio:
+            rows = self.span_pairs.close()
+        atomic_write(index_path(self.lang, self.name), jsonio.dumps(OrderedDict([
+            ('outputs', sorted(set(self.outputs) - {'stats'})),
+            ('fields', list(self.fields)),
+            ('compress', self.compress),
+            ('rate', self.rate),
+            ('documents', self.documents),
+            ('sentences', self.count),
+            ('stats', self.counter.state()),
+            ('sizes', sizes),
+            ('rows', rows)
+        ]), pretty=True), opener=open)
+        if 'stats' in self.outputs:
+            print("-" * 20 + ' ' + self.name + ' ' + "-" * 20)
+            self.counter.print()
+
+
+def check_append(lang, file_lists, outputs, compress, fields, rate=None):
+    """Reasons why the documents of `file_lists` cannot be appended to the outputs of a previous run.
+
+    Only the division by file lists can be continued: dividing the new sentences with
+    `rate` would not give the splits of a run over all the documents.
+    """
+    errors = []
+    known = set()
+    if rate:
+        errors.append('the division by sentence cannot be continued, divide by the file lists')
+    for name in ['train', 'dev', 'test']:
+        index = load_index(lang, name)
+        if index is None:
+            return ['there are no outputs of the %s split to append to, run transform.py without --append' % name]
+        if 'sizes' not in index:
+            return ['the index of the %s split has no output sizes, run transform.py without --append' % name]
+        if index['rate']:
+            errors.append('the %s outputs were divided by sentence' % name)
+        if index['outputs'] != sorted(set(outputs) - {'stats'}) or index['fields'] != list(fields):
+            errors.append('the %s outputs were written with --outputs %s --fields %s'
+                          % (name, ' '.join(index['outputs']), ' '.join(index['fields'])))
+        if index['compress'] != 'none' or compress != 'none':
+            errors.append('compressed outputs cannot be appended to')
+        known.update(index['documents'])
+    new = [file for name in ['train', 'dev', 'test'] for file in file_lists[name]]
+    duplicates = sorted(set(file for file in new if file in known or new.count(file) > 1))
+    if duplicates:
+        errors.append('%d documents are already in the outputs or listed twice: %s'
+                      % (len(duplicates), ' '.join(duplicates)))
+    return sorted(set(errors), key=errors.index)
+
+
+def print_count(data):
+    counter = EventCounter()
+    for con in data:
+        counter.update(con)
+    counter.print()
 
 
 def data_split(all_data, rate=[0.8, 0.1, 0.1]):
@@ -153,27 +437,104 @@ def data_split(all_data, rate=[0.8, 0.1, 0.1]):
     return train, dev, test
 
 
+def transform_out_of_core(lang, file_lists, rate=None, outputs=('json', 'stats'), compress='none', pretty=True,
+                          fields=(), workers=1, append=False):
+    """Stream the documents of every split to the output files, one document in memory at a time
+    (a few per worker with `workers` > 1).
+
+    With `rate`, every sentence is assigned to train/dev/test independently with those
+    probabilities instead of shuffling the whole corpus, so the split sizes are only
+    approximately proportional to `rate`.
+    """
+    language = lang_name[lang]
+    names = ['train', 'dev', 'test']
+    if 'bio' in outputs and not append:
+        reset_labels(r'output/BIO/')
+    writers = dict()
+    for name in names:
+        writers[name] = SplitWriter(lang, name, outputs, compress, pretty, fields, append, rate)
+    for name in names:
+        writers[name].documents += file_lists[name]
+        for doc_data, doc_tags in iter_documents(file_lists[name], language, fields, 'bio' in outputs, workers):
+            for idx, sent in enumerate(doc_data):
+                target = random.choices(names, weights=rate)[0] if rate else name
+                writers[target].write(sent, doc_tags[idx] if doc_tags else None)
+    for name in names:
+        writers[name].close()
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument('--lang', type=str, help="Name of the language", default='en',
                         choices=['en', 'ar', 'zh'])
+    parser.add_argument('--filelist', type=str, default='./filelist/',
+                        help="List of files for train/dev/test split")
+    parser.add_argument('--compress', type=str, default='none', choices=['none', 'gz', 'xz', 'zst'],
+                        help="Compression of the output json files")
+    parser.add_argument('--out-of-core', action='store_true',
+                        help="Stream documents to the outputs instead of loading the whole corpus")
+    parser.add_argument('--profile', type=str, default=None,
+                        help="Directory for cProfile (.prof) and tracemalloc reports of every stage")
+    parser.add_argument('--json-format', type=str, default='pretty', choices=['pretty', 'compact'],
+                        help="Layout of the output json files")
+    parser.add_argument('--fields', type=str, nargs='*', default=[], choices=sorted(token_fields),
+                        help="Per-token fields added to the output: character offsets and/or UD annotations")
+    parser.add_argument('--outputs', type=str, nargs='+', default=['json', 'stats'], choices=['json', 'bio', 'stats'],
+                        help="Outputs written in one pass: the split json files, the BIO files, the statistics")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes reading documents and tagging sentences")
+    parser.add_argument('--append', action='store_true',
+                        help="Append the documents of --filelist to the existing outputs instead of rewriting them")
     args = parser.parse_args()
+    pretty = args.json_format == 'pretty'
     language = lang_name[args.lang]
-    all_data = []
-    for name in ['train', 'dev', 'test']:
-        file_list = load_file_list(language=args.lang, name=name)
-        temp_data = load_processed_data(file_list, language=language, name=name)
-        globals()[name] = temp_data
-        all_data += temp_data
     sentence = input("whether divide by sentence level(y/n):") == 'y'
+    rate = None
     if sentence:
         rate = [float(i) for i in input("input the train/dev/test rate:").split()]
         assert sum(rate) == 1 and len(rate) == 3, "wrong rates!"
-        train, dev, test = data_split(all_data, rate)
 
+    file_lists = dict()
     for name in ['train', 'dev', 'test']:
-        save_path = r'output/' + str(args.lang) + '-' + name + '.json'
-        print("-" * 20 + ' ' + name + ' ' + "-" * 20)
-        print_count(eval(name))
-        save_data(eval(name), save_path)
+        file_lists[name] = load_file_list(language=args.lang, name=name, filelist=args.filelist)
+        missing = missing_documents(file_lists[name], language)
+        if missing:
+            raise SystemExit('%d %s documents are not in cache_data/, run format.py and extract.py for them: %s'
+                             % (len(missing), name, ' '.join(missing)))
+    if args.append:
+        errors = check_append(args.lang, file_lists, args.outputs, args.compress, args.fields, rate)
+        if errors:
+            raise SystemExit('Cannot append: ' + '; '.join(errors))
+
+    profiler = Profiler(args.profile, prefix='transform')
+    if args.out_of_core:
+        with profiler.stage('out_of_core'):
+            transform_out_of_core(args.lang, file_lists, rate, args.outputs, args.compress, pretty, args.fields,
+                                  args.workers, args.append)
+    else:
+        splits = dict()
+        all_data = []
+        with profiler.stage('load'):
+            for name in ['train', 'dev', 'test']:
+                splits[name] = load_processed_data(file_lists[name], language=language, fields=args.fields,
+                                                   workers=args.workers)
+                if sentence:
+                    all_data += splits[name]
+            if sentence:
+                splits['train'], splits['dev'], splits['test'] = data_split(all_data, rate)
+
+        with profiler.stage('save'):
+            if 'bio' in args.outputs and not args.append:
+                reset_labels(r'output/BIO/')
+            for name in ['train', 'dev', 'test']:
+                writer = SplitWriter(args.lang, name, args.outputs, args.compress, pretty, args.fields, args.append,
+                                     rate)
+                writer.documents += file_lists[name]
+                if 'bio' in args.outputs and args.workers > 1:
+                    for sent, tags in zip(splits[name], iter_sentence_tags(splits[name], args.workers)):
+                        writer.write(sent, tags)
+                else:
+                    for sent in splits[name]:
+                        writer.write(sent)
+                writer.close()
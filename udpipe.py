@@ -1,3 +1,8 @@
+import os
+import json
+import socket
+import struct
+import threading
 import ufal.udpipe
 
 
@@ -5,22 +10,156 @@ import ufal.udpipe
 # pylint: disable=no-member
 
 
+def send_message(sock, obj):
+    data = json.dumps(obj).encode('utf-8')
+    sock.sendall(struct.pack('>I', len(data)) + data)
+
+
+def recv_message(sock):
+    def recv_exactly(size):
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise EOFError('connection closed')
+            data += chunk
+        return data
+
+    size = struct.unpack('>I', recv_exactly(4))[0]
+    return json.loads(recv_exactly(size).decode('utf-8'))
+
+
+class RemoteSentence:
+    """Placeholder of a sentence tokenized by the annotation daemon.
+
+    The text of the sentence was already annotated by the daemon with the same request
+    that tokenized it, the output is kept in `batch`. Tagging and parsing only mark the
+    sentence; `write` returns the kept output if the marks match what was requested.
+    """
+
+    def __init__(self, batch, num_words):
+        self.batch = batch
+        self.words = range(num_words)
+        self.tagged = False
+        self.parsed = False
+
+
+class Client:
+    """Client of `udpipe_server.py`, serving the model `path` over a Unix domain socket."""
+
+    def __init__(self, socket_path, path):
+        self.socket_path = socket_path
+        self.model = os.path.basename(path)
+        # tag/parse flags `tokenize` requests, those of the previous `write`
+        self.flags = (True, True)
+        # texts announced by `expect`, their flags and annotation, {(text, tokenizer): batch}
+        self.expected = []
+        self.expected_flags = (False, False)
+        self.batches = dict()
+        self.lock = threading.Lock()
+
+    def request(self, request):
+        request['model'] = self.model
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.socket_path)
+            send_message(sock, request)
+            response = recv_message(sock)
+        if 'error' in response:
+            raise Exception(response['error'])
+        return response['results']
+
+    def process(self, texts, tokenizer_args=(), tag=True, parse=True, out_format='conllu'):
+        """Tokenize, optionally tag and parse a batch of texts, return them in `out_format`."""
+        return self.request({'op': 'process', 'texts': texts, 'tokenizer': list(tokenizer_args),
+                             'tag': tag, 'parse': parse, 'format': out_format})
+
+    def annotate_batch(self, texts, tokenizer, tag, parse):
+        """Tokenize, tag and parse `texts` in one request, return a batch dict of each text."""
+        results = self.request({'op': 'annotate', 'texts': texts, 'tokenizer': tokenizer,
+                                'tag': tag, 'parse': parse, 'format': 'conllu'})
+        return [{'text': text, 'tokenizer': tokenizer, 'tag': tag, 'parse': parse,
+                 'output': result['output'], 'words': result['words']}
+                for text, result in zip(texts, results)]
+
+    def expect(self, texts, tag=False, parse=False):
+        """Announce the texts about to be tokenized (with the default tokenizer options), e.g.
+        the mentions of a document; the first `tokenize` call annotates all of them in one
+        request. Forgets the texts announced before."""
+        with self.lock:
+            self.expected = list(dict.fromkeys(texts))
+            self.expected_flags = (tag, parse)
+            self.batches = dict()
+
+    def tokenize(self, text, tokenizer_args):
+        tokenizer = list(tokenizer_args)
+        with self.lock:
+            batch = self.batches.get((text, tuple(tokenizer)))
+            if batch is None and text in self.expected:
+                texts = [t for t in self.expected if (t, tuple(tokenizer)) not in self.batches]
+                for b in self.annotate_batch(texts, tokenizer, *self.expected_flags):
+                    self.batches[(b['text'], tuple(tokenizer))] = b
+                batch = self.batches[(text, tuple(tokenizer))]
+            elif batch is None:
+                batch = self.annotate_batch([text], tokenizer, *self.flags)[0]
+        return [RemoteSentence(batch, n) for n in batch['words']]
+
+    def write(self, sentences, out_format):
+        output = ''
+        idx = 0
+        while idx < len(sentences):
+            batch = sentences[idx].batch
+            group = [s for s in sentences[idx:] if s.batch is batch]
+            tagged = set(s.tagged for s in group)
+            parsed = set(s.parsed for s in group)
+            if len(tagged) > 1 or len(parsed) > 1:
+                raise Exception("Sentences of one text must be tagged/parsed together in client mode")
+            flags = (tagged.pop(), parsed.pop())
+            self.flags = flags
+            if out_format == 'conllu' and flags == (batch['tag'], batch['parse']):
+                output += batch['output']
+            else:
+                # annotated differently than speculated, e.g. the first text of a run
+                output += self.process([batch['text']], batch['tokenizer'], flags[0], flags[1], out_format)[0]
+            idx += len(group)
+        return output
+
+
 class Model:
-    def __init__(self, path):
-        """Load given model."""
+    def __init__(self, path, socket_path=None):
+        """Load given model, or use the annotation daemon listening on `socket_path`.
+
+        The daemon (`udpipe_server.py`) can also be selected with the UDPIPE_SOCKET
+        environment variable, which makes every script use it without changes.
+        """
+        if socket_path is None:
+            socket_path = os.environ.get('UDPIPE_SOCKET')
+        self.client = None
+        if socket_path:
+            self.client = Client(socket_path, path)
+            self.model = None
+            return
         self.model = ufal.udpipe.Model.load(path)
         if not self.model:
             raise Exception("Cannot load UDPipe model from file '%s'" % path)
 
     def tokenize(self, text, *args):
         """Tokenize the text and return list of ufal.udpipe.Sentence-s."""
+        if self.client is not None:
+            return self.client.tokenize(text, args)
         tokenizer = self.model.newTokenizer(*args)
         if not tokenizer:
             raise Exception("The model does not have a tokenizer")
         return self._read(text, tokenizer)
 
+    def expect(self, texts, tag=False, parse=False):
+        """Announce texts about to be tokenized, batched into one request in client mode."""
+        if self.client is not None:
+            self.client.expect(texts, tag, parse)
+
     def read(self, text, in_format):
         """Load text in the given format (conllu|horizontal|vertical) and return list of ufal.udpipe.Sentence-s."""
+        if self.client is not None:
+            raise Exception("Reading pre-tokenized text is not supported in client mode")
         input_format = ufal.udpipe.InputFormat.newInputFormat(in_format)
         if not input_format:
             raise Exception("Cannot create input format '%s'" % in_format)
@@ -42,14 +181,22 @@ class Model:
 
     def tag(self, sentence):
         """Tag the given ufal.udpipe.Sentence (inplace)."""
+        if self.client is not None:
+            sentence.tagged = True
+            return
         self.model.tag(sentence, self.model.DEFAULT)
 
     def parse(self, sentence):
         """Parse the given ufal.udpipe.Sentence (inplace)."""
+        if self.client is not None:
+            sentence.parsed = True
+            return
         self.model.parse(sentence, self.model.DEFAULT)
 
     def write(self, sentences, out_format):
         """Write given ufal.udpipe.Sentence-s in the required format (conllu|horizontal|vertical)."""
+        if self.client is not None:
+            return self.client.write(sentences, out_format)
 
         output_format = ufal.udpipe.OutputFormat.newOutputFormat(out_format)
         output = ''
@@ -0,0 +1,90 @@
+"""Annotation daemon keeping the UDPipe models loaded.
+
+    python udpipe_server.py --socket /tmp/ace-udpipe.sock --lang en zh
+    UDPIPE_SOCKET=/tmp/ace-udpipe.sock python format.py ...
+
+Requests and responses are length-prefixed json messages (see `udpipe.send_message`).
+A request names the model file, an `op` (`tokenize` returns the number of words of each
+sentence, `process` returns the tokenized and optionally tagged/parsed text in the given
+output format, `annotate` returns both as `{"output": ..., "words": [...]}`) and a batch
+of `texts`.
+"""
+import os
+import argparse
+import threading
+import socketserver
+from udpipe import Model, send_message, recv_message
+
+model_map = {
+    'en': 'udpipe/english-ewt-ud-2.5-191206.udpipe',
+    'zh': 'udpipe/chinese-gsd-ud-2.5-191206.udpipe',
+    'ar': 'udpipe/arabic-padt-ud-2.5-191206.udpipe'
+}
+
+
+class AnnotationServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, model_paths):
+        self.models = dict()
+        self.locks = dict()
+        for path in model_paths:
+            print('Loading {}'.format(path))
+            self.models[os.path.basename(path)] = Model(path, socket_path='')
+            self.locks[os.path.basename(path)] = threading.Lock()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, RequestHandler)
+
+    def handle_request_obj(self, request):
+        if request['model'] not in self.models:
+            raise Exception("Model '%s' is not served" % request['model'])
+        model = self.models[request['model']]
+        results = []
+        # the models are shared by the handler threads, annotate one batch at a time
+        with self.locks[request['model']]:
+            for text in request['texts']:
+                sentences = model.tokenize(text, *request['tokenizer'])
+                if request['op'] == 'tokenize':
+                    results.append([len(s.words) for s in sentences])
+                    continue
+                for s in sentences:
+                    if request['tag']:
+                        model.tag(s)
+                    if request['parse']:
+                        model.parse(s)
+                output = model.write(sentences, request['format'])
+                if request['op'] == 'annotate':
+                    results.append({'output': output, 'words': [len(s.words) for s in sentences]})
+                else:
+                    results.append(output)
+        return results
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            request = recv_message(self.request)
+        except EOFError:
+            return
+        try:
+            response = {'results': self.server.handle_request_obj(request)}
+        except Exception as e:
+            response = {'error': str(e)}
+        send_message(self.request, response)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', type=str, default='/tmp/ace-udpipe.sock',
+                        help="Path of the Unix domain socket")
+    parser.add_argument('--lang', type=str, nargs='+', default=['en'], choices=['en', 'ar', 'zh'],
+                        help="Languages whose models are kept loaded")
+    args = parser.parse_args()
+    server = AnnotationServer(args.socket, [model_map[lang] for lang in args.lang])
+    print('Serving on {}'.format(args.socket))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(args.socket)